@@ -6,29 +6,302 @@ import os
 from datetime import timedelta, datetime
 from typing import Optional
 import json
+from concurrent.futures import ThreadPoolExecutor
 import random
 import asyncio
 import time
+import threading
 import re
-from collections import defaultdict
+import string
+from collections import deque
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import heapify, heappop, heappush
+import functools
+import hashlib
+import math
+import signal
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+METRICS_FILE = os.getenv('METRICS_FILE')
+METRICS_INTERVAL = 15
+METRIC_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Metric family -> Prometheus label name
+METRIC_FAMILIES = {
+    'event': 'event',
+    'automod_filter': 'filter',
+    'command': 'command',
+    'db': 'query',
+    'rest': 'route',
+}
+
+class Histogram:
+    """Fixed-bucket latency histogram in seconds"""
+    __slots__ = ('buckets', 'count', 'total')
+
+    def __init__(self):
+        self.buckets = [0] * (len(METRIC_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(METRIC_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding quantile q (inf past the last bucket)"""
+        rank = q * self.count
+        seen = 0
+        for bound, hits in zip(METRIC_BUCKETS, self.buckets):
+            seen += hits
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+metrics = {family: {} for family in METRIC_FAMILIES}
+
+def get_histogram(family, label):
+    """Return the histogram for one label of a metric family, creating it on first use"""
+    histograms = metrics[family]
+    histogram = histograms.get(label)
+    if histogram is None:
+        histogram = histograms[label] = Histogram()
+    return histogram
+
+def timed(family, label):
+    """Decorate a coroutine function so every call is recorded in a metric family"""
+    def decorator(func):
+        histogram = get_histogram(family, label)
+        
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def observe_since(family, label, start):
+    """Record the time since start and return the current clock for chaining"""
+    now = time.perf_counter()
+    get_histogram(family, label).observe(now - start)
+    return now
+
+def format_prometheus():
+    """Render every histogram in the Prometheus text exposition format"""
+    lines = []
+    for family, label_name in METRIC_FAMILIES.items():
+        name = f"chrisbot_{family}_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for label, histogram in sorted(metrics[family].items()):
+            escaped = label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            labels = f'{label_name}="{escaped}"'
+            cumulative = 0
+            for bound, hits in zip(METRIC_BUCKETS, histogram.buckets):
+                cumulative += hits
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.total:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return "\n".join(lines) + "\n"
+
+def _replace_file(path, text):
+    # Write beside the target and rename so readers never see a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+@tasks.loop(seconds=METRICS_INTERVAL)
+async def write_metrics():
+    text = format_prometheus()
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _replace_file, METRICS_FILE, text)
+    except OSError as e:
+        print(f'❌ Failed to write metrics file: {e}')
+
+class MetricsCommandTree(app_commands.CommandTree):
+    """Command tree that records how long each slash command takes"""
+
+    async def interaction_check(self, interaction):
+        interaction.extras['started'] = time.perf_counter()
+        return True
+
+    def record_command(self, interaction, command):
+        started = interaction.extras.get('started')
+        if started is not None and command is not None:
+            get_histogram('command', command.qualified_name).observe(time.perf_counter() - started)
+
+    async def on_error(self, interaction, error):
+        self.record_command(interaction, interaction.command)
+        await super().on_error(interaction, error)
+
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+
+def parse_shard_ids(value):
+    """Parse SHARD_IDS such as "0,1,2" or "4-7" into a frozenset; None when unset (every shard)"""
+    if not value:
+        return None
+    shard_ids = set()
+    for part in value.split(','):
+        first, _, last = part.partition('-')
+        shard_ids.update(range(int(first), int(last or first) + 1))
+    return frozenset(shard_ids)
+
+SHARD_IDS = parse_shard_ids(os.getenv('SHARD_IDS'))
+
+def owns_guild(guild_id):
+    """Whether this process's shards receive guild_id's events; guild-less rows go to shard 0, like DMs"""
+    if not SHARD_COUNT or SHARD_IDS is None:
+        return True
+    shard_id = (guild_id >> 22) % SHARD_COUNT if guild_id else 0
+    return shard_id in SHARD_IDS
+
+if SHARD_COUNT:
+    # Cluster worker (see cluster.py): this process runs SHARD_IDS out of SHARD_COUNT shards
+    bot = commands.AutoShardedBot(command_prefix="!", intents=intents, tree_cls=MetricsCommandTree,
+                                  shard_count=SHARD_COUNT,
+                                  shard_ids=sorted(SHARD_IDS) if SHARD_IDS is not None else None)
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, tree_cls=MetricsCommandTree)
 bot_start_time = datetime.now()
 
-DB_FILE = "chrisbot_data.db"
+_http_request = bot.http.request
+
+async def _timed_http_request(route, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return await _http_request(route, *args, **kwargs)
+    finally:
+        get_histogram('rest', f"{route.method} {route.path}").observe(time.perf_counter() - start)
+
+bot.http.request = _timed_http_request
+
+TRACE_FILE = os.getenv('TRACE_FILE')
+TRACE_FLUSH_INTERVAL = 5
+# Structural words the link and invite filters look for; every other word is replaced
+TRACE_KEEP_WORDS = frozenset({'http', 'https', 'www', 'discord', 'discordapp', 'gg', 'com', 'invite'})
+TRACE_WORD_PATTERN = re.compile(r'[^\W\d_]+|\d+')
+TRACE_WORD_CACHE = 50000
+
+class TraceRecorder:
+    """Appends anonymized gateway events to a JSON-lines trace for tools/replay_trace.py
+
+    IDs become keyed hashes and every word becomes a keyed pseudo-word of the same
+    length and case, so repeats, duplicates and filter-relevant shape survive while
+    the text does not. Set TRACE_KEY to keep pseudonyms stable across restarts.
+    """
+    __slots__ = ('file', 'key', 'started', 'words')
+
+    def __init__(self, path, key):
+        self.file = open(path, 'a', encoding='utf-8', buffering=1 << 16)
+        self.key = key
+        self.started = time.monotonic()
+        self.words = {}
+        # Each process appends its own segment; event times are relative to its header
+        self.file.write(json.dumps({'trace': 1, 'started': int(time.time())}) + "\n")
+
+    def pseudonym(self, snowflake):
+        digest = hashlib.blake2b(snowflake.to_bytes(8, 'big'), key=self.key, digest_size=8).digest()
+        return int.from_bytes(digest, 'big') >> 1
+
+    def _pseudo_word(self, match):
+        word = match.group()
+        lowered = word.lower()
+        if lowered in TRACE_KEEP_WORDS:
+            return word
+        fake = self.words.get(lowered)
+        if fake is None:
+            if len(self.words) >= TRACE_WORD_CACHE:
+                self.words.clear()
+            digest = hashlib.blake2b(lowered.encode(), key=self.key).digest()
+            alphabet = string.digits if word.isdigit() else string.ascii_lowercase
+            fake = self.words[lowered] = ''.join(alphabet[b % len(alphabet)]
+                                                 for b in (digest * (len(word) // 64 + 1))[:len(word)])
+        if word == lowered:
+            return fake
+        return ''.join(c.upper() if o.isupper() else c for c, o in zip(fake, word))
+
+    def anonymize(self, text):
+        return TRACE_WORD_PATTERN.sub(self._pseudo_word, text) if text else ""
+
+    def write(self, kind, fields):
+        self.file.write(json.dumps([round(time.monotonic() - self.started, 3), kind, fields],
+                                   ensure_ascii=False, separators=(',', ':')) + "\n")
+
+    def message(self, kind, message, text):
+        self.write(kind, {'g': self.pseudonym(message.guild.id), 'c': self.pseudonym(message.channel.id),
+                          'a': self.pseudonym(message.author.id), 'id': self.pseudonym(message.id),
+                          'text': self.anonymize(text), 'm': len(message.mentions), 'r': len(message.role_mentions)})
+
+    def edit(self, before, after):
+        self.write('edit', {'g': self.pseudonym(before.guild.id), 'c': self.pseudonym(before.channel.id),
+                            'a': self.pseudonym(before.author.id), 'id': self.pseudonym(before.id),
+                            'before': self.anonymize(before.content), 'after': self.anonymize(after.content)})
+
+    def reaction(self, kind, payload):
+        self.write(kind, {'g': self.pseudonym(payload.guild_id), 'c': self.pseudonym(payload.channel_id),
+                          'u': self.pseudonym(payload.user_id), 'id': self.pseudonym(payload.message_id),
+                          'emoji': self.anonymize(str(payload.emoji))})
+
+    def member(self, kind, member):
+        self.write(kind, {'g': self.pseudonym(member.guild.id), 'u': self.pseudonym(member.id)})
+
+def _trace_key():
+    key = os.getenv('TRACE_KEY')
+    return hashlib.blake2b(key.encode(), digest_size=32).digest() if key else os.urandom(32)
+
+trace_recorder = TraceRecorder(TRACE_FILE, _trace_key()) if TRACE_FILE else None
+
+@tasks.loop(seconds=TRACE_FLUSH_INTERVAL)
+async def flush_trace():
+    trace_recorder.file.flush()
+
+HEALTH_FILE = os.getenv('HEALTH_FILE')
+HEALTH_INTERVAL = 15
+
+def health_snapshot():
+    """Summarize this process for cluster.py: shards, readiness, gateway latency and load"""
+    latencies = bot.latencies if SHARD_COUNT else [(0, bot.latency)]
+    return {
+        'pid': os.getpid(),
+        'shard_count': SHARD_COUNT or 1,
+        'shard_ids': sorted(SHARD_IDS) if SHARD_IDS is not None else list(range(SHARD_COUNT or 1)),
+        'ready': bot.is_ready(),
+        'guilds': len(bot.guilds),
+        'latency_ms': {str(shard_id): round(latency * 1000) if math.isfinite(latency) else None
+                       for shard_id, latency in latencies},
+        'messages': get_histogram('event', 'on_message').count,
+        'uptime': int((datetime.now() - bot_start_time).total_seconds()),
+        'updated': int(time.time()),
+    }
+
+async def save_health():
+    text = json.dumps(health_snapshot())
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, _replace_file, HEALTH_FILE, text)
+    except OSError as e:
+        print(f'❌ Failed to write health file: {e}')
 
-message_history = defaultdict(lambda: defaultdict(list))
+@tasks.loop(seconds=HEALTH_INTERVAL)
+async def write_health():
+    await save_health()
 
-def init_database():
-    """Initialize the database with all required tables"""
-    conn = sqlite3.connect(DB_FILE)
+DB_FILE = os.getenv('CHRISBOT_DB', 'chrisbot_data.db')
+
+def init_database(db_file=None, target=None):
+    """Create the base tables in db_file (default DB_FILE) and apply MIGRATIONS up to target"""
+    conn = sqlite3.connect(db_file or DB_FILE)
     cursor = conn.cursor()
     
+    # Version 0 layout; change the schema by appending to MIGRATIONS, not here
     cursor.execute('''CREATE TABLE IF NOT EXISTS custom_commands (
         guild_id TEXT, name TEXT, response TEXT, creator_id TEXT, created_at TEXT,
         PRIMARY KEY (guild_id, name))''')
@@ -140,109 +413,690 @@ def init_database():
         id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id TEXT, user_id TEXT,
         content TEXT, status TEXT DEFAULT 'pending', timestamp TEXT)''')
     
+    cursor.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL)''')
+    
     conn.commit()
+    apply_migrations(conn, target)
     conn.close()
 
+# Discord snowflake and timestamp columns per table, rewritten from TEXT to
+# INTEGER (snowflakes and Unix epoch seconds) by migration 2
+INTEGER_STORAGE_COLUMNS = {
+    'custom_commands': (('guild_id', 'creator_id'), ('created_at',)),
+    'infractions': (('guild_id', 'user_id', 'moderator_id'), ('timestamp',)),
+    'reaction_roles': (('message_id', 'guild_id', 'channel_id'), ()),
+    'reaction_role_mappings': (('message_id', 'role_id'), ()),
+    'guild_settings': (('guild_id', 'log_channel_id', 'mod_role_id', 'admin_role_id',
+                        'welcome_channel_id', 'goodbye_channel_id', 'suggest_channel_id',
+                        'verify_channel_id', 'verify_role_id', 'starboard_channel_id'), ()),
+    'log_events': (('guild_id',), ()),
+    'autoroles': (('guild_id', 'role_id'), ()),
+    'user_levels': (('guild_id', 'user_id'), ('last_xp_time',)),
+    'level_rewards': (('guild_id', 'role_id'), ()),
+    'tickets': (('channel_id', 'guild_id', 'user_id'), ('created_at',)),
+    'ticket_settings': (('guild_id', 'category_id'), ()),
+    'quotes': (('guild_id', 'added_by'), ('timestamp',)),
+    'reminders': (('user_id', 'channel_id'), ('remind_time', 'created_at')),
+    'suggestions': (('guild_id', 'user_id', 'message_id'), ('timestamp',)),
+    'mutes': (('guild_id', 'user_id'), ('muted_until',)),
+    'automod_settings': (('guild_id', 'log_channel_id'), ()),
+    'automod_banned_words': (('guild_id',), ()),
+    'automod_whitelist': (('guild_id',), ()),
+    'automod_immune_roles': (('guild_id', 'role_id'), ()),
+    'automod_immune_channels': (('guild_id', 'channel_id'), ()),
+    'automod_violations': (('guild_id', 'user_id'), ('timestamp',)),
+    'automod_user_violations': (('guild_id', 'user_id'), ()),
+    'economy': (('guild_id', 'user_id'), ('last_daily',)),
+    'events': (('guild_id', 'created_by'), ('datetime',)),
+    'applications': (('guild_id', 'user_id'), ('timestamp',)),
+}
+
+def _snowflake_to_int(value):
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+def _iso_to_epoch(value):
+    if isinstance(value, str):
+        try:
+            return int(datetime.fromisoformat(value).timestamp())
+        except ValueError:
+            return value
+    return value
+
+def migrate_integer_storage(cursor):
+    """Rebuild every table with INTEGER snowflake and epoch-second columns, converting rows in place"""
+    conn = cursor.connection
+    conn.create_function('snowflake_to_int', 1, _snowflake_to_int, deterministic=True)
+    conn.create_function('iso_to_epoch', 1, _iso_to_epoch, deterministic=True)
+    
+    for table, (id_columns, time_columns) in INTEGER_STORAGE_COLUMNS.items():
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        create_sql = cursor.fetchone()[0]
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                      (table,))
+        index_sql = [row[0] for row in cursor.fetchall()]
+        
+        for column in id_columns + time_columns:
+            create_sql, count = re.subn(rf'\b{column} TEXT\b', f'{column} INTEGER', create_sql)
+            if count != 1:
+                raise RuntimeError(f"Cannot find TEXT column {table}.{column} to migrate")
+        create_sql = create_sql.replace(f'CREATE TABLE {table} ', f'CREATE TABLE {table}__new ', 1)
+        
+        columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+        converted = [f'snowflake_to_int({c})' if c in id_columns else f'iso_to_epoch({c})' if c in time_columns else c
+                     for c in columns]
+        cursor.execute(create_sql)
+        cursor.execute(f'INSERT INTO {table}__new ({", ".join(columns)}) SELECT {", ".join(converted)} FROM {table}')
+        cursor.execute(f'DROP TABLE {table}')
+        cursor.execute(f'ALTER TABLE {table}__new RENAME TO {table}')
+        for statement in index_sql:
+            cursor.execute(statement)
+
+# Ordered schema changes applied on top of the base tables above. Each entry is
+# (description, steps), where a step is an SQL string or a function taking the
+# cursor; a database records how many it has applied in schema_version, so only
+# append to this list and never edit a shipped step.
+MIGRATIONS = [
+    ("Index hot lookup and polling queries", (
+        'CREATE INDEX IF NOT EXISTS idx_user_levels_guild_xp ON user_levels (guild_id, xp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_infractions_guild_user_type ON infractions (guild_id, user_id, type)',
+        'CREATE INDEX IF NOT EXISTS idx_automod_violations_guild_id ON automod_violations (guild_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_reminders_remind_time ON reminders (remind_time)',
+        'CREATE INDEX IF NOT EXISTS idx_mutes_muted_until ON mutes (muted_until)',
+        'CREATE INDEX IF NOT EXISTS idx_events_guild_datetime ON events (guild_id, datetime)',
+        'CREATE INDEX IF NOT EXISTS idx_quotes_guild ON quotes (guild_id)',
+    )),
+    ("Store Discord IDs as INTEGER and times as epoch seconds", (
+        migrate_integer_storage,
+    )),
+    ("Record the guild of each reminder for shard ownership", (
+        'ALTER TABLE reminders ADD COLUMN guild_id INTEGER',
+    )),
+]
+
+def get_schema_version(cursor):
+    """Return how many MIGRATIONS this database has applied"""
+    cursor.execute('SELECT version FROM schema_version WHERE id = 0')
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def apply_migrations(conn, target=None):
+    """Bring the database up to the latest schema, one migration per transaction"""
+    cursor = conn.cursor()
+    version = get_schema_version(cursor)
+    if version > len(MIGRATIONS):
+        raise RuntimeError(f"Database is at schema version {version}, newer than this bot ({len(MIGRATIONS)})")
+    
+    for number, (description, steps) in enumerate(MIGRATIONS[version:target], start=version + 1):
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            # Re-read under the write lock in case another process migrated first
+            if get_schema_version(cursor) >= number:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute('INSERT OR REPLACE INTO schema_version (id, version) VALUES (0, ?)', (number,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        print(f"🗄️ Applied migration {number}: {description}")
+
 init_database()
 
+DB_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 67108864',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA busy_timeout = 5000',
+)
+DB_STATEMENT_CACHE = 256
+
+db_local = threading.local()
+
 def get_db():
-    return sqlite3.connect(DB_FILE)
+    """Return this thread's long-lived database connection, opening and tuning it on first use"""
+    conn = getattr(db_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, cached_statements=DB_STATEMENT_CACHE)
+        for pragma in DB_PRAGMAS:
+            conn.execute(pragma)
+        db_local.conn = conn
+    return conn
+
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chrisbot-db")
+
+def _run_db_job(func, args):
+    conn = get_db()
+    try:
+        result = func(conn.cursor(), *args)
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return result
 
+async def run_db(func, *args):
+    """Run func(cursor, *args) as one transaction on the database thread"""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(db_executor, _run_db_job, func, args)
+    finally:
+        # Includes time queued behind other jobs on the database thread
+        label = query_label(args[0]) if func in QUERY_JOBS else func.__name__.lstrip('_')
+        get_histogram('db', label).observe(time.perf_counter() - start)
+
+query_labels = {}
+
+def query_label(query):
+    """Name a query by its verb and first table, e.g. "SELECT user_levels", so labels stay few"""
+    label = query_labels.get(query)
+    if label is None:
+        words = query.split()
+        table = next((word for keyword, word in zip(words, words[1:])
+                      if keyword.upper() in ('FROM', 'INTO', 'UPDATE')), None)
+        label = words[0].upper()
+        if table:
+            label += " " + table.split('(')[0]
+        query_labels[query] = label
+    return label
+
+def _fetchone(cursor, query, params):
+    return cursor.execute(query, params).fetchone()
+
+def _fetchall(cursor, query, params):
+    return cursor.execute(query, params).fetchall()
+
+def _execute(cursor, query, params):
+    return cursor.execute(query, params).rowcount
+
+# Jobs that run one query string; run_db labels these by the query instead of the job
+QUERY_JOBS = frozenset((_fetchone, _fetchall, _execute))
+
+async def db_fetchone(query, params=()):
+    """Run a query on the database thread and return its first row"""
+    return await run_db(_fetchone, query, params)
+
+async def db_fetchall(query, params=()):
+    """Run a query on the database thread and return all rows"""
+    return await run_db(_fetchall, query, params)
+
+async def db_execute(query, params=()):
+    """Run a write on the database thread, commit it and return the affected row count"""
+    return await run_db(_execute, query, params)
+
+AUTOMOD_SETTINGS_COLUMNS = (
+    'enabled', 'spam_enabled', 'links_enabled', 'invites_enabled', 'caps_enabled',
+    'mentions_enabled', 'words_enabled', 'emoji_enabled', 'duplicate_enabled',
+    'spam_threshold', 'spam_interval', 'caps_threshold', 'mentions_threshold',
+    'emoji_threshold', 'default_punishment', 'log_channel_id')
+
+class AutomodConfig:
+    """In-memory snapshot of one guild's auto-moderation configuration"""
+    __slots__ = AUTOMOD_SETTINGS_COLUMNS + ('immune_roles', 'immune_channels', 'whitelist')
+
+    def __init__(self, settings, immune_roles=(), immune_channels=(), whitelist=()):
+        for column, value in zip(AUTOMOD_SETTINGS_COLUMNS, settings):
+            setattr(self, column, value)
+        self.immune_roles = frozenset(immune_roles)
+        self.immune_channels = frozenset(immune_channels)
+        self.whitelist = tuple(whitelist)
+
+automod_configs = {}
+automod_config_loads = {}
+
+def load_automod_config(cursor, guild_id):
+    """Read a guild's auto-moderation settings and lists from the database"""
+    cursor.execute(f'SELECT {", ".join(AUTOMOD_SETTINGS_COLUMNS)} FROM automod_settings WHERE guild_id = ?',
+                  (guild_id,))
+    settings = cursor.fetchone()
+
+    if not settings:
+        return None
+    if not settings[0]:
+        return AutomodConfig(settings)
+
+    cursor.execute('SELECT role_id FROM automod_immune_roles WHERE guild_id = ?', (guild_id,))
+    immune_roles = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT channel_id FROM automod_immune_channels WHERE guild_id = ?', (guild_id,))
+    immune_channels = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT link FROM automod_whitelist WHERE guild_id = ?', (guild_id,))
+    whitelist = [row[0] for row in cursor.fetchall()]
+
+    return AutomodConfig(settings, immune_roles, immune_channels, whitelist)
+
+async def _load_automod_config(guild_id):
+    config = await run_db(load_automod_config, guild_id)
+    # An invalidation while this load was in flight means the result may predate the change
+    if guild_id in automod_config_loads:
+        automod_configs[guild_id] = config
+    return config
+
+async def get_automod_config(guild_id):
+    """Return a guild's cached auto-moderation config, loading it once for all concurrent misses"""
+    guild_id = int(guild_id)
+    try:
+        return automod_configs[guild_id]
+    except KeyError:
+        return await shared_load(automod_config_loads, guild_id, lambda: _load_automod_config(guild_id))
+
+def invalidate_automod_config(guild_id):
+    """Drop a guild's cached auto-moderation config so the next message reloads it"""
+    automod_configs.pop(int(guild_id), None)
+    automod_config_loads.pop(int(guild_id), None)
+
+class WordMatcher:
+    """Aho-Corasick automaton that finds every banned word in a single pass over the text"""
+    __slots__ = ('goto', 'fail', 'output', 'size')
+
+    def __init__(self, words):
+        goto = [{}]
+        output = [()]
+        for word in words:
+            if not word:
+                continue
+            node = 0
+            for char in word:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = goto[node][char] = len(goto)
+                    goto.append({})
+                    output.append(())
+                node = next_node
+            if word not in output[node]:
+                output[node] = (word,)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                output[child] = output[child] + output[fail[child]]
+
+        self.goto = goto
+        self.fail = fail
+        self.output = output
+        self.size = sum(1 for words in output if words)
+
+    def finditer(self, text):
+        """Yield (end_index, word) for every banned word occurring in text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for word in output[node]:
+                yield index, word
+
+    def search(self, text):
+        """Return the first banned word found in text, or None"""
+        goto, fail, output = self.goto, self.fail, self.output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                return output[node][0]
+        return None
+
+word_matchers = {}
+word_matcher_loads = {}
+
+def load_word_matcher(cursor, guild_id):
+    """Read a guild's banned words and compile them into a WordMatcher"""
+    cursor.execute('SELECT word FROM automod_banned_words WHERE guild_id = ?', (guild_id,))
+    return WordMatcher(row[0].lower() for row in cursor.fetchall())
+
+async def _load_word_matcher(guild_id):
+    matcher = await run_db(load_word_matcher, guild_id)
+    # An invalidation while this build was in flight means the word list may have changed
+    if guild_id in word_matcher_loads:
+        word_matchers[guild_id] = matcher
+    return matcher
+
+async def get_word_matcher(guild_id):
+    """Return a guild's compiled banned-word matcher, building it once for all concurrent misses"""
+    guild_id = int(guild_id)
+    matcher = word_matchers.get(guild_id)
+    if matcher is None:
+        matcher = await shared_load(word_matcher_loads, guild_id, lambda: _load_word_matcher(guild_id))
+    return matcher
+
+def invalidate_word_matcher(guild_id):
+    """Drop a guild's compiled banned-word matcher after its word list changes"""
+    word_matchers.pop(int(guild_id), None)
+    word_matcher_loads.pop(int(guild_id), None)
+
+async def shared_load(loads, key, load):
+    """Await load() once for all concurrent callers with the same key, so a burst costs one query"""
+    future = loads.get(key)
+    if future is None:
+        future = loads[key] = asyncio.ensure_future(load())
+        # Only clear our own entry; an invalidation may already have replaced it with a newer load
+        future.add_done_callback(lambda done: loads.get(key) is done and loads.pop(key))
+    return await asyncio.shield(future)
+
+GUILD_SETTINGS_COLUMNS = (
+    'log_channel_id', 'mod_role_id', 'admin_role_id', 'welcome_channel_id', 'welcome_message',
+    'goodbye_channel_id', 'goodbye_message', 'leveling_enabled', 'suggest_channel_id',
+    'verify_channel_id', 'verify_role_id', 'starboard_channel_id', 'starboard_threshold')
+GUILD_SETTINGS_DEFAULTS = {**dict.fromkeys(GUILD_SETTINGS_COLUMNS), 'leveling_enabled': 1, 'starboard_threshold': 5}
+GUILD_SETTINGS_TTL = 600
+NO_DISABLED_EVENTS = frozenset()
+
+class GuildSettings:
+    """One guild's guild_settings row, plus its autoroles and disabled log events"""
+    __slots__ = GUILD_SETTINGS_COLUMNS + ('autorole_ids', 'disabled_log_events', 'expires')
+
+    def __init__(self, row, autorole_ids, disabled_log_events, expires):
+        for column, value in zip(GUILD_SETTINGS_COLUMNS, row):
+            setattr(self, column, value)
+        self.autorole_ids = tuple(autorole_ids)
+        self.disabled_log_events = frozenset(disabled_log_events) if disabled_log_events else NO_DISABLED_EVENTS
+        self.expires = expires
+
+guild_settings_cache = {}
+guild_settings_loads = {}
+
+def _load_guild_settings(cursor, guild_id):
+    cursor.execute(f'SELECT {", ".join(GUILD_SETTINGS_COLUMNS)} FROM guild_settings WHERE guild_id = ?', (guild_id,))
+    row = cursor.fetchone() or tuple(GUILD_SETTINGS_DEFAULTS.values())
+    cursor.execute('SELECT role_id FROM autoroles WHERE guild_id = ?', (guild_id,))
+    autorole_ids = [r[0] for r in cursor.fetchall()]
+    cursor.execute('SELECT event_type FROM log_events WHERE guild_id = ? AND enabled IS NOT 1', (guild_id,))
+    disabled_log_events = [r[0] for r in cursor.fetchall()]
+    return GuildSettings(row, autorole_ids, disabled_log_events, time.monotonic() + GUILD_SETTINGS_TTL)
+
+async def _refresh_guild_settings(guild_id):
+    settings = guild_settings_cache[guild_id] = await run_db(_load_guild_settings, guild_id)
+    return settings
+
+async def get_guild_settings(guild_id):
+    """Return a guild's cached settings; edits made outside the bot are picked up within GUILD_SETTINGS_TTL"""
+    settings = guild_settings_cache.get(guild_id)
+    if settings is None or settings.expires <= time.monotonic():
+        settings = await shared_load(guild_settings_loads, guild_id, lambda: _refresh_guild_settings(guild_id))
+    return settings
+
+def _write_guild_settings(cursor, guild_id, values):
+    columns = ", ".join(values)
+    placeholders = ", ".join("?" * len(values))
+    updates = ", ".join(f"{column} = excluded.{column}" for column in values)
+    cursor.execute(f'''INSERT INTO guild_settings (guild_id, {columns}) VALUES (?, {placeholders})
+                   ON CONFLICT(guild_id) DO UPDATE SET {updates}''', (guild_id, *values.values()))
+    return _load_guild_settings(cursor, guild_id)
+
+async def update_guild_settings(guild_id, **values):
+    """Write guild_settings columns and refresh the cached GuildSettings in the same transaction"""
+    unknown = set(values) - set(GUILD_SETTINGS_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown guild settings: {', '.join(sorted(unknown))}")
+    await get_guild_settings(guild_id)
+    settings = guild_settings_cache[guild_id] = await run_db(_write_guild_settings, guild_id, values)
+    return settings
+
+LOG_BATCH_SIZE = 10
+LOG_BATCH_CHARS = 6000
+LOG_BATCH_DELAY = 1.0
+
+class LogQueue:
+    """Embeds waiting to be sent to one log channel"""
+    __slots__ = ('channel', 'embeds', 'full')
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.embeds = []
+        self.full = asyncio.Event()
+
+class LogDispatcher:
+    """Batches log embeds per channel into messages of up to LOG_BATCH_SIZE embeds"""
+    __slots__ = ('queues',)
+
+    def __init__(self):
+        self.queues = {}
+
+    def enqueue(self, channel, embed):
+        """Queue an embed; it is sent within LOG_BATCH_DELAY seconds, sooner once a batch fills"""
+        queue = self.queues.get(channel.id)
+        if queue is None:
+            queue = self.queues[channel.id] = LogQueue(channel)
+            asyncio.create_task(self.drain(queue))
+        queue.embeds.append(embed)
+        if len(queue.embeds) >= LOG_BATCH_SIZE:
+            queue.full.set()
+
+    async def drain(self, queue):
+        split = False
+        try:
+            while queue.embeds:
+                if len(queue.embeds) < LOG_BATCH_SIZE and not split:
+                    queue.full.clear()
+                    try:
+                        await asyncio.wait_for(queue.full.wait(), LOG_BATCH_DELAY)
+                    except asyncio.TimeoutError:
+                        pass
+                
+                # Discord caps a message at 10 embeds and 6000 embed characters in total
+                count, chars = 0, 0
+                for embed in queue.embeds[:LOG_BATCH_SIZE]:
+                    chars += len(embed)
+                    if count and chars > LOG_BATCH_CHARS:
+                        break
+                    count += 1
+                split = count < min(len(queue.embeds), LOG_BATCH_SIZE)
+                batch = queue.embeds[:count]
+                del queue.embeds[:count]
+                try:
+                    await queue.channel.send(embeds=batch)
+                except:
+                    pass
+        finally:
+            del self.queues[queue.channel.id]
+
+log_dispatcher = LogDispatcher()
+
+@timed('event', 'log_event')
 async def log_event(guild_id, event_type, embed):
     """Log events to the configured log channel"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT log_channel_id FROM guild_settings WHERE guild_id = ?', (str(guild_id),))
-    result = cursor.fetchone()
-    
-    if result and result[0]:
-        cursor.execute('SELECT enabled FROM log_events WHERE guild_id = ? AND event_type = ?',
-                      (str(guild_id), event_type))
-        event_check = cursor.fetchone()
-        
-        if not event_check or event_check[0] == 1:
-            try:
-                channel = bot.get_channel(int(result[0]))
-                if channel:
-                    await channel.send(embed=embed)
-            except:
-                pass
-    conn.close()
+    settings = await get_guild_settings(guild_id)
+    if settings.log_channel_id and event_type not in settings.disabled_log_events:
+        channel = bot.get_channel(settings.log_channel_id)
+        if channel:
+            log_dispatcher.enqueue(channel, embed)
 
-async def log_automod_action(guild_id, user_id, violation_type, action_taken, details=""):
-    """Log auto-moderation actions to database and channel"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    timestamp = datetime.now().isoformat()
-    cursor.execute('''INSERT INTO automod_violations 
-                   (guild_id, user_id, violation_type, action_taken, timestamp, details)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                 (str(guild_id), str(user_id), violation_type, action_taken, timestamp, details))
+def _record_automod_violations(cursor, guild_id, user_id, violation_type, action_taken, all_details):
+    timestamp = int(time.time())
+    cursor.executemany('''INSERT INTO automod_violations 
+                       (guild_id, user_id, violation_type, action_taken, timestamp, details)
+                       VALUES (?, ?, ?, ?, ?, ?)''',
+                       [(guild_id, user_id, violation_type, action_taken, timestamp, details) for details in all_details])
     
     cursor.execute('''INSERT INTO automod_user_violations (guild_id, user_id, violation_count)
-                   VALUES (?, ?, 1)
-                   ON CONFLICT(guild_id, user_id) DO UPDATE SET violation_count = violation_count + 1''',
-                 (str(guild_id), str(user_id)))
-    
-    conn.commit()
-    
-    cursor.execute('SELECT log_channel_id FROM automod_settings WHERE guild_id = ?', (str(guild_id),))
-    result = cursor.fetchone()
-    
-    if result and result[0]:
-        try:
-            channel = bot.get_channel(int(result[0]))
-            if channel:
-                embed = discord.Embed(
-                    title="🛡️ Auto-Moderation Action",
-                    color=discord.Color.red(),
-                    timestamp=datetime.now()
-                )
-                guild = bot.get_guild(int(guild_id))
-                user = guild.get_member(int(user_id)) if guild else None
-                embed.add_field(name="User", value=user.mention if user else f"<@{user_id}>", inline=True)
-                embed.add_field(name="Violation", value=violation_type, inline=True)
-                embed.add_field(name="Action", value=action_taken, inline=True)
-                if details:
-                    embed.add_field(name="Details", value=details[:1024], inline=False)
-                await channel.send(embed=embed)
-        except:
-            pass
-    
-    conn.close()
-
-def check_automod_immunity(guild_id, member, channel_id):
+                   VALUES (?, ?, ?)
+                   ON CONFLICT(guild_id, user_id) DO UPDATE SET violation_count = violation_count + excluded.violation_count''',
+                 (guild_id, user_id, len(all_details)))
+
+async def log_automod_action(guild_id, user_id, violation_type, action_taken, details="", repeats=()):
+    """Log auto-moderation actions to database and channel; repeats holds the details of folded repeat violations"""
+    await run_db(_record_automod_violations, guild_id, user_id, violation_type, action_taken, [details, *repeats])
+    if repeats:
+        details = f"{details} (+{len(repeats)} repeats)".lstrip()
+
+    config = await get_automod_config(guild_id)
+    if config and config.log_channel_id:
+        channel = bot.get_channel(config.log_channel_id)
+        if channel:
+            embed = discord.Embed(
+                title="🛡️ Auto-Moderation Action",
+                color=discord.Color.red(),
+                timestamp=datetime.now()
+            )
+            guild = bot.get_guild(guild_id)
+            user = guild.get_member(user_id) if guild else None
+            embed.add_field(name="User", value=user.mention if user else f"<@{user_id}>", inline=True)
+            embed.add_field(name="Violation", value=violation_type, inline=True)
+            embed.add_field(name="Action", value=action_taken, inline=True)
+            if details:
+                embed.add_field(name="Details", value=details[:1024], inline=False)
+            log_dispatcher.enqueue(channel, embed)
+
+URL_PATTERN = re.compile(r'https?://[^\s]+')
+INVITE_PATTERN = re.compile(r'(discord\.gg|discord\.com\/invite|discordapp\.com\/invite)\/[a-zA-Z0-9]+', re.IGNORECASE)
+CUSTOM_EMOJI_PATTERN = re.compile(r'<a?:[a-zA-Z0-9_]+:[0-9]+>')
+UNICODE_EMOJI_PATTERN = re.compile(r'[\U0001F300-\U0001F9FF]')
+ASCII_UPPERCASE = string.ascii_uppercase.encode()
+
+class MessageFeatures:
+    """Everything the auto-moderation filters need to know about a message's content"""
+    __slots__ = ('length', 'lowered', 'caps_percent', 'urls', 'has_invite', 'emoji_count',
+                 'mention_count', 'content_hash')
+
+def extract_message_features(message):
+    """Collect the features used by the filters, skipping scans the content cannot match"""
+    content = message.content
+    features = MessageFeatures()
+    features.length = len(content)
+    features.lowered = lowered = content.lower()
+    features.urls = URL_PATTERN.findall(content) if 'http' in content else []
+    features.has_invite = 'discord' in lowered and INVITE_PATTERN.search(content) is not None
+    features.mention_count = len(message.mentions) + len(message.role_mentions)
+    features.content_hash = hash(content)
+
+    emoji_count = len(CUSTOM_EMOJI_PATTERN.findall(content)) if '<' in content else 0
+    if content.isascii():
+        raw = content.encode('ascii')
+        caps_count = len(raw) - len(raw.translate(None, ASCII_UPPERCASE))
+    else:
+        caps_count = sum(map(str.isupper, content))
+        emoji_count += len(UNICODE_EMOJI_PATTERN.findall(content))
+    features.emoji_count = emoji_count
+    features.caps_percent = (caps_count / len(content)) * 100 if content else 0
+    return features
+
+class SpamTracker:
+    """Fixed-size ring of recent message times per (guild, user) for the spam filter"""
+
+    def __init__(self):
+        self.rings = {}
+        self.intervals = {}
+
+    def record(self, guild_id, user_id, threshold, interval, now=None):
+        """Record a message and return the number of messages in the window if it exceeds the threshold, else 0"""
+        now = time.monotonic() if now is None else now
+        key = (guild_id, user_id)
+        # Rows saved before /automod settings validated thresholds may hold 0 or less
+        threshold = max(threshold, 1)
+        ring = self.rings.get(key)
+        if ring is None or ring.maxlen != threshold + 1:
+            ring = self.rings[key] = deque(ring or (), maxlen=threshold + 1)
+        ring.append(now)
+        self.intervals[guild_id] = interval
+
+        if len(ring) == ring.maxlen and now - ring[0] < interval:
+            return len(ring)
+        return 0
+
+    def sweep(self, now=None):
+        """Forget users whose last message is older than their guild's spam interval"""
+        now = time.monotonic() if now is None else now
+        intervals = self.intervals
+        idle = [key for key, ring in self.rings.items() if now - ring[-1] >= intervals.get(key[0], 0)]
+        for key in idle:
+            del self.rings[key]
+        active_guilds = {guild_id for guild_id, _ in self.rings}
+        for guild_id in [g for g in intervals if g not in active_guilds]:
+            del intervals[guild_id]
+        return len(idle)
+
+spam_tracker = SpamTracker()
+
+DUPLICATE_WINDOW = 30
+DUPLICATE_LIMIT = 3
+DUPLICATE_MAX_ENTRIES = 50
+
+class DuplicateTracker:
+    """Per-user window of content fingerprints for the duplicate filter
+
+    Each user's window is one bytes object of packed int64 (milliseconds, fingerprint)
+    pairs, oldest first: 33 bytes of object header plus 16 per message.
+    """
+
+    def __init__(self, window=DUPLICATE_WINDOW, max_entries=DUPLICATE_MAX_ENTRIES):
+        self.window = window
+        self.max_entries = max_entries
+        # guild_id -> user_id -> packed window; nesting reuses the member's ID object as the key
+        self.guilds = {}
+
+    def record(self, guild_id, user_id, fingerprint, now=None):
+        """Record a message fingerprint and return how often it was seen inside the window"""
+        now = time.monotonic() if now is None else now
+        stamp = int(now * 1000)
+        users = self.guilds.get(guild_id)
+        if users is None:
+            users = self.guilds[guild_id] = {}
+        entries = array('q', users.get(user_id, b''))
+
+        cutoff = stamp - self.window * 1000
+        start = 0
+        while start < len(entries) and entries[start] <= cutoff:
+            start += 2
+        del entries[:max(start, len(entries) - 2 * (self.max_entries - 1))]
+
+        count = entries[1::2].count(fingerprint) + 1
+        entries.append(stamp)
+        entries.append(fingerprint)
+        users[user_id] = entries.tobytes()
+        return count
+
+    def sweep(self, now=None):
+        """Forget users whose newest message has left the window"""
+        now = time.monotonic() if now is None else now
+        cutoff = int(now * 1000) - self.window * 1000
+        swept = 0
+        for guild_id, users in list(self.guilds.items()):
+            idle = [user_id for user_id, entries in users.items() if array('q', entries[-16:-8])[0] <= cutoff]
+            for user_id in idle:
+                del users[user_id]
+            if not users:
+                del self.guilds[guild_id]
+            swept += len(idle)
+        return swept
+
+duplicate_tracker = DuplicateTracker()
+
+def check_automod_immunity(config, member, channel_id):
     """Check if a member or channel is immune to auto-moderation"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT role_id FROM automod_immune_roles WHERE guild_id = ?', (str(guild_id),))
-    immune_roles = [int(row[0]) for row in cursor.fetchall()]
-    
-    if any(role.id in immune_roles for role in member.roles):
-        conn.close()
+    if int(channel_id) in config.immune_channels:
         return True
-    
-    cursor.execute('SELECT channel_id FROM automod_immune_channels WHERE guild_id = ?', (str(guild_id),))
-    immune_channels = [int(row[0]) for row in cursor.fetchall()]
-    
-    conn.close()
-    return int(channel_id) in immune_channels
+    return any(role.id in config.immune_roles for role in member.roles)
+
+def _record_automod_warnings(cursor, guild_id, user_id, violation_type, count):
+    cursor.executemany('''INSERT INTO infractions 
+                       (guild_id, user_id, type, reason, moderator_id, timestamp)
+                       VALUES (?, ?, ?, ?, ?, ?)''',
+                       [(guild_id, user_id, 'warn', f'Auto-mod: {violation_type}', bot.user.id, int(time.time()))] * count)
 
-async def automod_punish(member, violation_type, punishment_type, details=""):
-    """Execute auto-moderation punishment"""
+async def automod_punish(member, violation_type, punishment_type, details="", count=1):
+    """Execute auto-moderation punishment; count violations folded together earn count warnings but one DM"""
     try:
         if punishment_type == "warn":
-            conn = get_db()
-            cursor = conn.cursor()
-            cursor.execute('''INSERT INTO infractions 
-                           (guild_id, user_id, type, reason, moderator_id, timestamp)
-                           VALUES (?, ?, ?, ?, ?, ?)''',
-                         (str(member.guild.id), str(member.id), 'warn', 
-                          f'Auto-mod: {violation_type}', str(bot.user.id), datetime.now().isoformat()))
-            conn.commit()
-            conn.close()
+            await run_db(_record_automod_warnings, member.guild.id, member.id, violation_type, count)
             try:
                 await member.send(f"⚠️ You have been warned in **{member.guild.name}** for: {violation_type}")
             except:
@@ -267,177 +1121,334 @@ async def automod_punish(member, violation_type, punishment_type, details=""):
     except Exception as e:
         print(f"Error in automod_punish: {e}")
 
+ENFORCEMENT_CONCURRENCY = 50
+ENFORCEMENT_PER_GUILD = 10
+
+class EnforcementQueue:
+    """Per-member FIFOs of auto-moderation follow-ups, drained concurrently across members within a global and a per-guild limit"""
+    __slots__ = ('queues', 'limit', 'guild_limits')
+
+    def __init__(self):
+        # (guild_id, user_id) -> deque of [member, violation_type, punishment, details, repeat details]
+        self.queues = {}
+        # Created on first use so it binds to the running loop
+        self.limit = None
+        # guild_id -> [semaphore, members with queued follow-ups]
+        self.guild_limits = {}
+
+    def submit(self, member, violation_type, punishment, details=""):
+        """Queue logging and punishment for a violation behind the member's earlier ones"""
+        key = (member.guild.id, member.id)
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            asyncio.create_task(self.drain(key, queue))
+        else:
+            # A member flooding violations needs one DM, punishment and log embed per kind, not one per
+            # deleted message; each repeat is still recorded
+            for entry in queue:
+                if entry[1] == violation_type and entry[2] == punishment:
+                    entry[4].append(details)
+                    return
+        queue.append([member, violation_type, punishment, details, []])
+
+    async def drain(self, key, queue):
+        guild_id = key[0]
+        if self.limit is None:
+            self.limit = asyncio.Semaphore(ENFORCEMENT_CONCURRENCY)
+        slot = self.guild_limits.get(guild_id)
+        if slot is None:
+            slot = self.guild_limits[guild_id] = [asyncio.Semaphore(ENFORCEMENT_PER_GUILD), 0]
+        slot[1] += 1
+        try:
+            while queue:
+                # Punishments share the guild's rate-limit bucket, so take the guild slot before a global one
+                async with slot[0], self.limit:
+                    member, violation_type, punishment, details, repeats = queue.popleft()
+                    results = await asyncio.gather(
+                        log_automod_action(guild_id, member.id, violation_type, punishment, details, repeats),
+                        automod_punish(member, violation_type, punishment, count=len(repeats) + 1),
+                        return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"Error in automod enforcement: {result}")
+        finally:
+            del self.queues[key]
+            slot[1] -= 1
+            if not slot[1]:
+                del self.guild_limits[guild_id]
+
+enforcement_queue = EnforcementQueue()
+
+async def enforce_automod(message, violation_type, punishment, details=""):
+    """Delete the offending message now and leave logging and punishment to the member's queue"""
+    try:
+        await message.delete()
+    except discord.HTTPException:
+        pass
+    enforcement_queue.submit(message.author, violation_type, punishment, details)
+    return True
+
+@timed('event', 'check_automod')
 async def check_automod(message):
     """Main auto-moderation check function"""
     if message.author.bot or not message.guild:
         return False
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM automod_settings WHERE guild_id = ?', (str(message.guild.id),))
-    settings = cursor.fetchone()
-    
-    if not settings or settings[1] == 0:
-        conn.close()
+    config = await get_automod_config(message.guild.id)
+    if not config or not config.enabled:
         return False
     
-    if check_automod_immunity(message.guild.id, message.author, message.channel.id):
-        conn.close()
+    if check_automod_immunity(config, message.author, message.channel.id):
         return False
     
-    enabled, spam_en, links_en, invites_en, caps_en, mentions_en, words_en, emoji_en, dup_en = settings[1:10]
-    spam_thresh, spam_int, caps_thresh, ment_thresh, emoji_thresh = settings[10:15]
-    punishment = settings[15]
+    spam_en, links_en, invites_en, caps_en = config.spam_enabled, config.links_enabled, config.invites_enabled, config.caps_enabled
+    mentions_en, words_en, emoji_en, dup_en = config.mentions_enabled, config.words_enabled, config.emoji_enabled, config.duplicate_enabled
+    spam_thresh, spam_int, caps_thresh = config.spam_threshold, config.spam_interval, config.caps_threshold
+    ment_thresh, emoji_thresh = config.mentions_threshold, config.emoji_threshold
+    punishment = config.default_punishment
     
-    content = message.content
+    # Each filter is timed up to its decision; enforcement is measured as its own work
+    start = time.perf_counter()
+    features = extract_message_features(message)
+    start = observe_since('automod_filter', 'features', start)
     
     if spam_en:
-        user_id = str(message.author.id)
-        guild_id = str(message.guild.id)
-        current_time = time.time()
-        message_history[guild_id][user_id].append(current_time)
-        message_history[guild_id][user_id] = [t for t in message_history[guild_id][user_id] if current_time - t < spam_int]
-        
-        if len(message_history[guild_id][user_id]) > spam_thresh:
-            await message.delete()
-            await log_automod_action(message.guild.id, message.author.id, "Spam", punishment, 
-                                    f"{len(message_history[guild_id][user_id])} messages in {spam_int}s")
-            await automod_punish(message.author, "Spam", punishment)
-            conn.close()
-            return True
+        recent_count = spam_tracker.record(message.guild.id, message.author.id, spam_thresh, spam_int)
+        start = observe_since('automod_filter', 'spam', start)
+        if recent_count:
+            return await enforce_automod(message, "Spam", punishment, 
+                                         f"{recent_count} messages in {spam_int}s")
     
     if invites_en:
-        invite_pattern = r'(discord\.gg|discord\.com\/invite|discordapp\.com\/invite)\/[a-zA-Z0-9]+'
-        if re.search(invite_pattern, content, re.IGNORECASE):
-            await message.delete()
-            await log_automod_action(message.guild.id, message.author.id, "Discord Invite", punishment)
-            await automod_punish(message.author, "Discord Invite", punishment)
-            conn.close()
-            return True
+        has_invite = features.has_invite
+        start = observe_since('automod_filter', 'invites', start)
+        if has_invite:
+            return await enforce_automod(message, "Discord Invite", punishment)
     
     if links_en:
-        url_pattern = r'https?://[^\s]+'
-        urls = re.findall(url_pattern, content)
-        if urls:
-            cursor.execute('SELECT link FROM automod_whitelist WHERE guild_id = ?', (str(message.guild.id),))
-            whitelist = [row[0] for row in cursor.fetchall()]
-            
-            if not any(wl in url for url in urls for wl in whitelist):
-                await message.delete()
-                await log_automod_action(message.guild.id, message.author.id, "Unauthorized Link", punishment)
-                await automod_punish(message.author, "Unauthorized Link", punishment)
-                conn.close()
-                return True
-    
-    if caps_en and len(content) > 10:
-        caps_count = sum(1 for c in content if c.isupper())
-        caps_percent = (caps_count / len(content)) * 100
+        urls = features.urls
+        unauthorized = urls and not any(wl in url for url in urls for wl in config.whitelist)
+        start = observe_since('automod_filter', 'links', start)
+        if unauthorized:
+            return await enforce_automod(message, "Unauthorized Link", punishment)
+    
+    if caps_en and features.length > 10:
+        caps_percent = features.caps_percent
+        start = observe_since('automod_filter', 'caps', start)
         if caps_percent > caps_thresh:
-            await message.delete()
-            await log_automod_action(message.guild.id, message.author.id, "Excessive Caps", punishment, 
-                                    f"{int(caps_percent)}% caps")
-            await automod_punish(message.author, "Excessive Caps", punishment)
-            conn.close()
-            return True
+            return await enforce_automod(message, "Excessive Caps", punishment, 
+                                         f"{int(caps_percent)}% caps")
     
     if mentions_en:
-        mention_count = len(message.mentions) + len(message.role_mentions)
+        mention_count = features.mention_count
+        start = observe_since('automod_filter', 'mentions', start)
         if mention_count > ment_thresh:
-            await message.delete()
-            await log_automod_action(message.guild.id, message.author.id, "Mass Mentions", punishment, 
-                                    f"{mention_count} mentions")
-            await automod_punish(message.author, "Mass Mentions", punishment)
-            conn.close()
-            return True
+            return await enforce_automod(message, "Mass Mentions", punishment, 
+                                         f"{mention_count} mentions")
     
     if words_en:
-        cursor.execute('SELECT word FROM automod_banned_words WHERE guild_id = ?', (str(message.guild.id),))
-        banned_words = [row[0].lower() for row in cursor.fetchall()]
-        content_lower = content.lower()
-        
-        for word in banned_words:
-            if word in content_lower:
-                await message.delete()
-                await log_automod_action(message.guild.id, message.author.id, "Banned Word", punishment, 
-                                        f"Word: {word}")
-                await automod_punish(message.author, "Banned Word", punishment)
-                conn.close()
-                return True
+        word = (await get_word_matcher(message.guild.id)).search(features.lowered)
+        start = observe_since('automod_filter', 'words', start)
+        if word:
+            return await enforce_automod(message, "Banned Word", punishment, 
+                                         f"Word: {word}")
     
     if emoji_en:
-        emoji_count = len(re.findall(r'<a?:[a-zA-Z0-9_]+:[0-9]+>', content))
-        emoji_count += len(re.findall(r'[\U0001F300-\U0001F9FF]', content))
-        
+        emoji_count = features.emoji_count
+        start = observe_since('automod_filter', 'emoji', start)
         if emoji_count > emoji_thresh:
-            await message.delete()
-            await log_automod_action(message.guild.id, message.author.id, "Emoji Spam", punishment, 
-                                    f"{emoji_count} emojis")
-            await automod_punish(message.author, "Emoji Spam", punishment)
-            conn.close()
-            return True
+            return await enforce_automod(message, "Emoji Spam", punishment, 
+                                         f"{emoji_count} emojis")
     
     if dup_en:
-        guild_id = str(message.guild.id)
-        user_id = str(message.author.id)
-        
-        if not hasattr(bot, 'duplicate_tracker'):
-            bot.duplicate_tracker = defaultdict(lambda: defaultdict(list))
-        
-        bot.duplicate_tracker[guild_id][user_id].append((content, time.time()))
-        bot.duplicate_tracker[guild_id][user_id] = [
-            (msg, t) for msg, t in bot.duplicate_tracker[guild_id][user_id] 
-            if time.time() - t < 30
-        ]
-        
-        recent_messages = [msg for msg, _ in bot.duplicate_tracker[guild_id][user_id]]
-        if recent_messages.count(content) >= 3:
-            await message.delete()
-            await log_automod_action(message.guild.id, message.author.id, "Duplicate Text", punishment)
-            await automod_punish(message.author, "Duplicate Text", punishment)
-            conn.close()
-            return True
+        seen = duplicate_tracker.record(message.guild.id, message.author.id, features.content_hash)
+        observe_since('automod_filter', 'duplicate', start)
+        if seen >= DUPLICATE_LIMIT:
+            return await enforce_automod(message, "Duplicate Text", punishment)
     
-    conn.close()
     return False
 
 @bot.event
-async def on_ready():
-    print(f'🤖 {bot.user} is now online!')
-    print(f'🔧 Chris-bot is ready to moderate!')
-    print(f'📊 Using database: {DB_FILE}')
+async def setup_hook():
+    # Client.run only handles SIGINT; close cleanly on SIGTERM too so the final XP flush runs
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(bot.close()))
+    except NotImplementedError:
+        pass
+    # Before login, so cluster.py can tell a starting worker from a dead one
+    if HEALTH_FILE:
+        write_health.start()
+
+COMMAND_SYNC_FILE = os.getenv('COMMAND_SYNC_FILE', 'command_sync.json')
+
+def _command_payload(command):
+    try:
+        return command.to_dict(bot.tree)
+    except TypeError:
+        # discord.py before 2.4 takes no tree argument
+        return command.to_dict()
+
+def command_tree_fingerprint():
+    """Hash what a global sync would upload: every command and group, plus the application it belongs to"""
+    payloads = sorted((_command_payload(command) for command in bot.tree.get_commands()),
+                      key=lambda payload: (payload.get('type', 1), payload['name']))
+    data = json.dumps({'application_id': bot.application_id, 'commands': payloads},
+                      sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+def read_synced_fingerprint():
+    try:
+        with open(COMMAND_SYNC_FILE) as f:
+            return json.load(f).get('fingerprint')
+    except (OSError, ValueError):
+        return None
+
+async def sync_commands():
+    """Sync the global command tree unless it is unchanged since the last successful sync"""
+    fingerprint = command_tree_fingerprint()
+    if fingerprint == read_synced_fingerprint() and not os.getenv('FORCE_COMMAND_SYNC'):
+        print('✅ Commands unchanged since last sync, skipping')
+        return
     try:
         synced = await bot.tree.sync()
-        print(f'✅ Synced {len(synced)} command(s)')
     except Exception as e:
         print(f'❌ Failed to sync commands: {e}')
+        return
+    print(f'✅ Synced {len(synced)} command(s)')
+    try:
+        _replace_file(COMMAND_SYNC_FILE, json.dumps({'fingerprint': fingerprint, 'synced': int(time.time())}))
+    except OSError as e:
+        print(f'❌ Failed to record command sync: {e}')
+
+startup_done = False
+
+@bot.event
+async def on_ready():
+    global startup_done
+    if HEALTH_FILE:
+        await save_health()
+    # on_ready fires again after every gateway reconnect; start-up work runs once per process
+    if startup_done:
+        print(f'🔄 {bot.user} reconnected')
+        return
+    startup_done = True
+    
+    print(f'🤖 {bot.user} is now online!')
+    print(f'🔧 Chris-bot is ready to moderate!')
+    print(f'📊 Using database: {DB_FILE}')
+    if SHARD_COUNT:
+        print(f'🧩 Running shards {sorted(SHARD_IDS or range(SHARD_COUNT))} of {SHARD_COUNT}')
+    # Commands are global, so in a cluster only the worker with shard 0 syncs them
+    if owns_guild(None):
+        await sync_commands()
     check_reminders.start()
     check_mutes.start()
+    sweep_automod_trackers.start()
+    flush_xp.start()
+    if METRICS_FILE:
+        write_metrics.start()
+    if trace_recorder:
+        flush_trace.start()
+
+@bot.event
+async def on_app_command_completion(interaction, command):
+    bot.tree.record_command(interaction, command)
+
+JOIN_BURST_THRESHOLD = int(os.getenv('JOIN_BURST_THRESHOLD', '10'))
+JOIN_BURST_WINDOW = 10
+JOIN_SUMMARY_INTERVAL = 15
+
+def format_member_list(members, limit):
+    """Join member mentions into at most limit characters, ending with "and N more" if cut short"""
+    text = ""
+    for shown, member in enumerate(members):
+        suffix = f" and {len(members) - shown} more"
+        if len(text) + len(member.mention) + 2 + len(suffix) > limit:
+            return (text + suffix).lstrip()
+        text = f"{text}, {member.mention}" if text else member.mention
+    return text
+
+class JoinGate:
+    """Per-guild join rate tracking; joins above JOIN_BURST_THRESHOLD per JOIN_BURST_WINDOW become summaries"""
+    __slots__ = ('joins', 'pending')
+
+    def __init__(self):
+        self.joins = {}
+        self.pending = {}
+
+    def admit(self, guild_id, now=None):
+        """Record a join and return True if it should be announced on its own"""
+        now = time.monotonic() if now is None else now
+        times = self.joins.get(guild_id)
+        if times is None:
+            times = self.joins[guild_id] = deque(maxlen=JOIN_BURST_THRESHOLD + 1)
+        times.append(now)
+        return len(times) <= JOIN_BURST_THRESHOLD or times[0] <= now - JOIN_BURST_WINDOW
+
+    def defer(self, member):
+        """Hold a join for the guild's next summary"""
+        members = self.pending.get(member.guild.id)
+        if members is None:
+            members = self.pending[member.guild.id] = []
+            asyncio.create_task(self.summarize(member.guild, members))
+        members.append(member)
+
+    async def summarize(self, guild, members):
+        try:
+            while True:
+                await asyncio.sleep(JOIN_SUMMARY_INTERVAL)
+                batch = members[:]
+                members.clear()
+                try:
+                    await send_join_summary(guild, batch)
+                except Exception as e:
+                    print(f"Error sending join summary: {e}")
+                if not members:
+                    break
+        finally:
+            del self.pending[guild.id]
+
+join_gate = JoinGate()
+
+async def send_join_summary(guild, members):
+    """Announce and log a batch of joins as one welcome message and one log embed"""
+    settings = await get_guild_settings(guild.id)
+    if settings.welcome_channel_id and settings.welcome_message:
+        channel = bot.get_channel(settings.welcome_channel_id)
+        if channel:
+            template = settings.welcome_message.replace('{server}', guild.name)
+            mentions = format_member_list(members, 2000 - len(template))
+            await channel.send(template.replace('{user}', mentions)[:2000])
+    
+    embed = discord.Embed(title="👋 Members Joined", description=f"{len(members)} members joined", color=discord.Color.green())
+    embed.add_field(name="Users", value=format_member_list(members, 1024), inline=False)
+    await log_event(guild.id, 'member_join', embed)
 
 @bot.event
+@timed('event', 'on_member_join')
 async def on_member_join(member):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT welcome_channel_id, welcome_message FROM guild_settings WHERE guild_id = ?',
-                  (str(member.guild.id),))
-    result = cursor.fetchone()
+    if trace_recorder:
+        trace_recorder.member('join', member)
+    settings = await get_guild_settings(member.guild.id)
     
-    if result and result[0] and result[1]:
-        channel = bot.get_channel(int(result[0]))
+    roles = [role for role in map(member.guild.get_role, settings.autorole_ids) if role]
+    if roles:
+        try:
+            await member.add_roles(*roles, atomic=False)
+        except:
+            pass
+    
+    if not join_gate.admit(member.guild.id):
+        join_gate.defer(member)
+        return
+    
+    if settings.welcome_channel_id and settings.welcome_message:
+        channel = bot.get_channel(settings.welcome_channel_id)
         if channel:
-            message = result[1].replace('{user}', member.mention).replace('{server}', member.guild.name)
+            message = settings.welcome_message.replace('{user}', member.mention).replace('{server}', member.guild.name)
             await channel.send(message)
     
-    cursor.execute('SELECT role_id FROM autoroles WHERE guild_id = ?', (str(member.guild.id),))
-    autoroles = cursor.fetchall()
-    for (role_id,) in autoroles:
-        role = member.guild.get_role(int(role_id))
-        if role:
-            try:
-                await member.add_roles(role)
-            except:
-                pass
-    conn.close()
-    
     embed = discord.Embed(title="👋 Member Joined", color=discord.Color.green())
     embed.add_field(name="User", value=member.mention, inline=True)
     embed.add_field(name="Account Created", value=member.created_at.strftime("%Y-%m-%d"), inline=True)
@@ -446,18 +1457,15 @@ async def on_member_join(member):
 
 @bot.event
 async def on_member_remove(member):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT goodbye_channel_id, goodbye_message FROM guild_settings WHERE guild_id = ?',
-                  (str(member.guild.id),))
-    result = cursor.fetchone()
+    if trace_recorder:
+        trace_recorder.member('leave', member)
+    settings = await get_guild_settings(member.guild.id)
     
-    if result and result[0] and result[1]:
-        channel = bot.get_channel(int(result[0]))
+    if settings.goodbye_channel_id and settings.goodbye_message:
+        channel = bot.get_channel(settings.goodbye_channel_id)
         if channel:
-            message = result[1].replace('{user}', str(member)).replace('{server}', member.guild.name)
+            message = settings.goodbye_message.replace('{user}', str(member)).replace('{server}', member.guild.name)
             await channel.send(message)
-    conn.close()
     
     embed = discord.Embed(title="👋 Member Left", color=discord.Color.red())
     embed.add_field(name="User", value=str(member), inline=True)
@@ -468,6 +1476,8 @@ async def on_member_remove(member):
 async def on_message_delete(message):
     if message.author.bot or not message.guild:
         return
+    if trace_recorder:
+        trace_recorder.message('delete', message, message.content)
     embed = discord.Embed(title="🗑️ Message Deleted", color=discord.Color.orange())
     embed.add_field(name="Author", value=message.author.mention, inline=True)
     embed.add_field(name="Channel", value=message.channel.mention, inline=True)
@@ -478,6 +1488,8 @@ async def on_message_delete(message):
 async def on_message_edit(before, after):
     if before.author.bot or not before.guild or before.content == after.content:
         return
+    if trace_recorder:
+        trace_recorder.edit(before, after)
     embed = discord.Embed(title="✏️ Message Edited", color=discord.Color.blue())
     embed.add_field(name="Author", value=before.author.mention, inline=True)
     embed.add_field(name="Channel", value=before.channel.mention, inline=True)
@@ -485,96 +1497,290 @@ async def on_message_edit(before, after):
     embed.add_field(name="After", value=after.content[:512] if after.content else "No content", inline=False)
     await log_event(before.guild.id, 'message_edit', embed)
 
+XP_COOLDOWN = 60
+XP_FLUSH_INTERVAL = 5
+XP_IDLE_EVICT = 600
+
+LEADERBOARD_PAGE_SIZE = 10
+
+class XPRecord:
+    """In-memory leveling state for one member, written back to user_levels in batches"""
+    __slots__ = ('xp', 'level', 'last_xp_time', 'dirty', 'ranked')
+
+    def __init__(self, xp=0, level=0, last_xp_time=None, ranked=False):
+        self.xp = xp
+        self.level = level
+        self.last_xp_time = last_xp_time
+        self.dirty = False
+        self.ranked = ranked
+
+class GuildLeaderboard:
+    """Sorted XP values for one guild, giving O(log n) rank lookups"""
+    __slots__ = ('xp_values',)
+
+    def __init__(self, xp_values):
+        self.xp_values = array('q', sorted(xp_values))
+
+    def __len__(self):
+        return len(self.xp_values)
+
+    def rank_of(self, xp):
+        """Return the 1-based rank of an XP total; ties share the best rank"""
+        return len(self.xp_values) - bisect_right(self.xp_values, xp) + 1
+
+    def update(self, old_xp, new_xp):
+        """Move a member from old_xp (None if unranked) to new_xp"""
+        values = self.xp_values
+        if old_xp is not None:
+            index = bisect_left(values, old_xp)
+            if index < len(values) and values[index] == old_xp:
+                del values[index]
+        insort(values, new_xp)
+
+leaderboards = {}
+
+async def get_leaderboard(guild_id):
+    """Return a guild's leaderboard, loading it from the XP index on first use"""
+    board = leaderboards.get(guild_id)
+    if board is None:
+        rows = await db_fetchall('SELECT user_id, xp FROM user_levels WHERE guild_id = ?', (guild_id,))
+        board = leaderboards.get(guild_id)
+        if board is None:
+            xp_by_user = dict(rows)
+            for (record_guild, user_id), record in xp_records.items():
+                if record_guild == guild_id and record.ranked:
+                    xp_by_user[user_id] = record.xp
+            board = leaderboards[guild_id] = GuildLeaderboard(xp_by_user.values())
+    return board
+
+xp_records = {}
+xp_cooldowns = {}
+
+def xp_on_cooldown(key, now):
+    """Check the in-memory cooldown table for a (guild_id, user_id) key"""
+    expiry = xp_cooldowns.get(key)
+    return expiry is not None and expiry > now
+
+async def get_xp_record(guild_id, user_id):
+    """Return a member's cached leveling state, reading it from user_levels on first use"""
+    key = (guild_id, user_id)
+    record = xp_records.get(key)
+    if record is None:
+        row = await db_fetchone('SELECT xp, level, last_xp_time FROM user_levels WHERE guild_id = ? AND user_id = ?',
+                                (guild_id, user_id))
+        record = xp_records.get(key)
+        if record is None:
+            if row:
+                record = XPRecord(row[0], row[1], row[2], ranked=True)
+                if record.last_xp_time:
+                    remaining = XP_COOLDOWN - (time.time() - record.last_xp_time)
+                    if remaining > 0:
+                        xp_cooldowns[key] = time.monotonic() + remaining
+            else:
+                record = XPRecord()
+            xp_records[key] = record
+    return record
+
+async def award_message_xp(guild_id, user_id):
+    """Grant message XP if the user is off cooldown; return (new_level, reward_role_id) on a level-up"""
+    key = (guild_id, user_id)
+    if xp_on_cooldown(key, time.monotonic()):
+        return None
+    
+    if (await get_guild_settings(guild_id)).leveling_enabled != 1:
+        return None
+    
+    record = await get_xp_record(guild_id, user_id)
+    now = time.monotonic()
+    if xp_on_cooldown(key, now):
+        return None
+    xp_cooldowns[key] = now + XP_COOLDOWN
+    
+    old_xp = record.xp if record.ranked else None
+    record.xp += random.randint(15, 25)
+    record.last_xp_time = int(time.time())
+    record.dirty = True
+    record.ranked = True
+    
+    board = leaderboards.get(guild_id)
+    if board is not None:
+        board.update(old_xp, record.xp)
+    
+    new_level = int(record.xp ** 0.5 / 10)
+    if new_level <= record.level:
+        return None
+    record.level = new_level
+    
+    reward = await db_fetchone('SELECT role_id FROM level_rewards WHERE guild_id = ? AND level = ?',
+                               (guild_id, new_level))
+    return new_level, reward[0] if reward else None
+
+def _collect_dirty_xp():
+    rows = []
+    for (guild_id, user_id), record in xp_records.items():
+        if record.dirty:
+            record.dirty = False
+            rows.append((guild_id, user_id, record.xp, record.level, record.last_xp_time))
+    return rows
+
+def _write_xp_rows(cursor, rows):
+    cursor.executemany('''INSERT INTO user_levels (guild_id, user_id, xp, level, last_xp_time)
+                       VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(guild_id, user_id) DO UPDATE SET
+                       xp = excluded.xp, level = excluded.level, last_xp_time = excluded.last_xp_time''', rows)
+
+async def flush_pending_xp():
+    """Write every changed XP record to user_levels in one transaction"""
+    rows = _collect_dirty_xp()
+    if not rows:
+        return 0
+    try:
+        await run_db(_write_xp_rows, rows)
+    except Exception:
+        for guild_id, user_id, *_ in rows:
+            record = xp_records.get((guild_id, user_id))
+            if record:
+                record.dirty = True
+        raise
+    return len(rows)
+
+def flush_pending_xp_sync():
+    """Write every changed XP record from the calling thread, for use after the event loop stops"""
+    rows = _collect_dirty_xp()
+    if rows:
+        _run_db_job(_write_xp_rows, (rows,))
+
+@tasks.loop(seconds=XP_FLUSH_INTERVAL)
+async def flush_xp():
+    # tasks.loop stops for good on anything but network errors; the records stay dirty for the next pass
+    try:
+        await flush_pending_xp()
+    except Exception as e:
+        print(f"Error flushing XP: {e}")
+    
+    now = time.monotonic()
+    expired = [key for key, expiry in xp_cooldowns.items() if expiry <= now]
+    for key in expired:
+        del xp_cooldowns[key]
+    
+    cutoff = time.time() - XP_IDLE_EVICT
+    idle = [key for key, record in xp_records.items()
+            if not record.dirty and (record.last_xp_time is None or record.last_xp_time < cutoff)]
+    for key in idle:
+        del xp_records[key]
+
+custom_command_cache = {}
+custom_command_loads = {}
+
+async def _load_custom_commands(guild_id):
+    rows = await db_fetchall('SELECT name, response FROM custom_commands WHERE guild_id = ?', (guild_id,))
+    commands_by_name = custom_command_cache[guild_id] = dict(rows)
+    return commands_by_name
+
+async def get_custom_commands(guild_id):
+    """Return a guild's custom commands as a name -> response dict, loading it on first use"""
+    commands_by_name = custom_command_cache.get(guild_id)
+    if commands_by_name is None:
+        commands_by_name = await shared_load(custom_command_loads, guild_id, lambda: _load_custom_commands(guild_id))
+    return commands_by_name
+
+async def save_custom_command(guild_id, name, response, creator_id):
+    """Create or replace a custom command in the database and the cache"""
+    commands_by_name = await get_custom_commands(guild_id)
+    await db_execute('''INSERT OR REPLACE INTO custom_commands (guild_id, name, response, creator_id, created_at)
+                     VALUES (?, ?, ?, ?, ?)''', (guild_id, name, response, creator_id, int(time.time())))
+    commands_by_name[name] = response
+
+async def delete_custom_command(guild_id, name):
+    """Delete a custom command from the database and the cache; return True if it existed"""
+    commands_by_name = await get_custom_commands(guild_id)
+    deleted = await db_execute('DELETE FROM custom_commands WHERE guild_id = ? AND name = ?', (guild_id, name))
+    commands_by_name.pop(name, None)
+    return deleted > 0
+
 @bot.event
+@timed('event', 'on_message')
 async def on_message(message):
     if message.author.bot or not message.guild:
         return
+    if trace_recorder:
+        trace_recorder.message('message', message, message.content)
     
     if await check_automod(message):
         return
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT leveling_enabled FROM guild_settings WHERE guild_id = ?', (str(message.guild.id),))
-    result = cursor.fetchone()
-    
-    if not result or result[0] == 1:
-        cursor.execute('SELECT xp, level, last_xp_time FROM user_levels WHERE guild_id = ? AND user_id = ?',
-                      (str(message.guild.id), str(message.author.id)))
-        user_data = cursor.fetchone()
-        
-        current_time = datetime.now()
-        can_gain_xp = True
+    level_up = await award_message_xp(message.guild.id, message.author.id)
+    if level_up:
+        new_level, reward_role_id = level_up
+        await message.channel.send(f"🎉 {message.author.mention} leveled up to **Level {new_level}**!")
         
-        if user_data and user_data[2]:
-            last_xp = datetime.fromisoformat(user_data[2])
-            if (current_time - last_xp).total_seconds() < 60:
-                can_gain_xp = False
-        
-        if can_gain_xp:
-            xp_gain = random.randint(15, 25)
-            if user_data:
-                new_xp = user_data[0] + xp_gain
-                current_level = user_data[1]
-                new_level = int(new_xp ** 0.5 / 10)
-                
-                cursor.execute('''UPDATE user_levels SET xp = ?, level = ?, last_xp_time = ?
-                               WHERE guild_id = ? AND user_id = ?''',
-                             (new_xp, new_level, current_time.isoformat(), str(message.guild.id), str(message.author.id)))
-                
-                if new_level > current_level:
-                    await message.channel.send(f"🎉 {message.author.mention} leveled up to **Level {new_level}**!")
-                    
-                    cursor.execute('SELECT role_id FROM level_rewards WHERE guild_id = ? AND level = ?',
-                                 (str(message.guild.id), new_level))
-                    reward = cursor.fetchone()
-                    if reward:
-                        role = message.guild.get_role(int(reward[0]))
-                        if role:
-                            await message.author.add_roles(role)
-                            await message.channel.send(f"🎁 {message.author.mention} earned the {role.mention} role!")
-            else:
-                cursor.execute('''INSERT INTO user_levels (guild_id, user_id, xp, level, last_xp_time)
-                               VALUES (?, ?, ?, ?, ?)''',
-                             (str(message.guild.id), str(message.author.id), xp_gain, 0, current_time.isoformat()))
-        
-        conn.commit()
-    conn.close()
+        if reward_role_id:
+            role = message.guild.get_role(reward_role_id)
+            if role:
+                await message.author.add_roles(role)
+                await message.channel.send(f"🎁 {message.author.mention} earned the {role.mention} role!")
     
     if message.content.startswith("!"):
-        command_name = message.content[1:].split()[0]
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('SELECT response FROM custom_commands WHERE guild_id = ? AND name = ?',
-                      (str(message.guild.id), command_name))
-        result = cursor.fetchone()
-        conn.close()
-        if result:
-            await message.channel.send(result[0])
+        words = message.content[1:].split(maxsplit=1)
+        if words:
+            response = (await get_custom_commands(message.guild.id)).get(words[0])
+            if response:
+                await message.channel.send(response)
     
     await bot.process_commands(message)
 
+REACTION_ROLE_TTL = 300
+
+class ReactionRoleIndex:
+    """message_id -> emoji -> role_id for every reaction-role message"""
+    __slots__ = ('roles', 'expires')
+
+    def __init__(self, rows, expires):
+        self.roles = {}
+        for message_id, emoji, role_id in rows:
+            self.roles.setdefault(message_id, {})[emoji] = role_id
+        self.expires = expires
+
+reaction_role_index = None
+reaction_role_loads = {}
+
+async def _refresh_reaction_role_index():
+    global reaction_role_index
+    rows = await db_fetchall('SELECT message_id, emoji, role_id FROM reaction_role_mappings')
+    reaction_role_index = ReactionRoleIndex(rows, time.monotonic() + REACTION_ROLE_TTL)
+    return reaction_role_index
+
+async def get_reaction_role(message_id, emoji):
+    """Return the role_id mapped to an emoji on a reaction-role message, or None"""
+    index = reaction_role_index
+    if index is None or index.expires <= time.monotonic():
+        index = await shared_load(reaction_role_loads, None, _refresh_reaction_role_index)
+    emojis = index.roles.get(message_id)
+    return emojis.get(str(emoji)) if emojis else None
+
+async def get_reaction_member(guild, payload):
+    """Return the reacting member from the payload or member cache, fetching only on a cache miss"""
+    member = payload.member or guild.get_member(payload.user_id)
+    if member is None:
+        member = await guild.fetch_member(payload.user_id)
+    return member
+
 @bot.event
 async def on_raw_reaction_add(payload):
     if payload.user_id == bot.user.id:
         return
+    if trace_recorder and payload.guild_id:
+        trace_recorder.reaction('reaction_add', payload)
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT role_id FROM reaction_role_mappings
-                   WHERE message_id = ? AND emoji = ?''',
-                 (str(payload.message_id), str(payload.emoji)))
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
+    role_id = await get_reaction_role(payload.message_id, payload.emoji)
+    if role_id:
         guild = bot.get_guild(payload.guild_id)
         if not guild:
             return
-        role = guild.get_role(int(result[0]))
+        role = guild.get_role(role_id)
         if role:
             try:
-                member = await guild.fetch_member(payload.user_id)
+                member = await get_reaction_member(guild, payload)
                 if member:
                     await member.add_roles(role)
             except:
@@ -582,72 +1788,157 @@ async def on_raw_reaction_add(payload):
 
 @bot.event
 async def on_raw_reaction_remove(payload):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT role_id FROM reaction_role_mappings
-                   WHERE message_id = ? AND emoji = ?''',
-                 (str(payload.message_id), str(payload.emoji)))
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
+    if trace_recorder and payload.guild_id:
+        trace_recorder.reaction('reaction_remove', payload)
+    role_id = await get_reaction_role(payload.message_id, payload.emoji)
+    if role_id:
         guild = bot.get_guild(payload.guild_id)
         if not guild:
             return
-        role = guild.get_role(int(result[0]))
+        role = guild.get_role(role_id)
         if role:
             try:
-                member = await guild.fetch_member(payload.user_id)
+                member = await get_reaction_member(guild, payload)
                 if member:
                     await member.remove_roles(role)
             except:
                 pass
 
 @tasks.loop(minutes=1)
+async def sweep_automod_trackers():
+    # tasks.loop stops for good on anything but network errors, so a failed sweep must not escape
+    try:
+        spam_tracker.sweep()
+        duplicate_tracker.sweep()
+    except Exception as e:
+        print(f"Error sweeping automod trackers: {e}")
+
+REMINDER_HORIZON = 3600
+
+def _delete_reminders(cursor, reminder_ids):
+    cursor.executemany('DELETE FROM reminders WHERE id = ?', [(reminder_id,) for reminder_id in reminder_ids])
+
+class ReminderScheduler:
+    """Min-heap of reminders due within the next REMINDER_HORIZON seconds, fired at their exact deadline"""
+    __slots__ = ('heap', 'pending', 'loaded_until', 'wake')
+
+    def __init__(self):
+        self.heap = []
+        self.pending = {}
+        self.loaded_until = 0
+        self.wake = None
+
+    async def load(self, now):
+        """Merge every reminder due before now + REMINDER_HORIZON into the heap"""
+        horizon = now + REMINDER_HORIZON
+        rows = await db_fetchall('''SELECT id, remind_time, user_id, channel_id, message, guild_id FROM reminders
+                                 WHERE remind_time <= ?''', (horizon,))
+        for reminder_id, *entry in rows:
+            # In a cluster each worker fires only the reminders of guilds on its shards
+            if owns_guild(entry[-1]):
+                self.pending[reminder_id] = tuple(entry)
+        self.heap = [(entry[0], reminder_id) for reminder_id, entry in self.pending.items()]
+        heapify(self.heap)
+        self.loaded_until = horizon
+
+    def add(self, reminder_id, remind_time, user_id, channel_id, message, guild_id):
+        """Schedule a freshly inserted reminder if it falls inside the loaded horizon"""
+        if remind_time <= self.loaded_until and reminder_id not in self.pending:
+            self.pending[reminder_id] = (remind_time, user_id, channel_id, message, guild_id)
+            heappush(self.heap, (remind_time, reminder_id))
+            if self.wake:
+                self.wake.set()
+
+    async def run_due(self):
+        """Fire every due reminder, delete them in one batch, then sleep until the next deadline"""
+        if self.wake is None:
+            self.wake = asyncio.Event()
+        self.wake.clear()
+        now = time.time()
+        if now >= self.loaded_until:
+            await self.load(now)
+        
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, reminder_id = heappop(self.heap)
+            entry = self.pending.pop(reminder_id, None)
+            if entry:
+                due.append((reminder_id, entry))
+        
+        for _, (_, user_id, channel_id, message, guild_id) in due:
+            try:
+                channel = bot.get_channel(channel_id)
+                if channel is None and guild_id is None:
+                    # Reminders stored before guild_id was recorded may point at another shard's channel
+                    channel = await bot.fetch_channel(channel_id)
+                if channel:
+                    await channel.send(f"⏰ <@{user_id}> Reminder: {message}")
+            except:
+                pass
+        if due:
+            await run_db(_delete_reminders, [reminder_id for reminder_id, _ in due])
+        
+        deadline = min(self.heap[0][0], self.loaded_until) if self.heap else self.loaded_until
+        timeout = deadline - time.time()
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+reminder_scheduler = ReminderScheduler()
+
+def _insert_reminder(cursor, user_id, channel_id, remind_time, message, guild_id):
+    cursor.execute('''INSERT INTO reminders (user_id, channel_id, remind_time, message, created_at, guild_id)
+                   VALUES (?, ?, ?, ?, ?, ?)''', (user_id, channel_id, remind_time, message, int(time.time()), guild_id))
+    return cursor.lastrowid
+
+async def add_reminder(user_id, channel_id, remind_time, message, guild_id=None):
+    """Store a reminder and hand it to the scheduler so it fires on time without waiting for a reload"""
+    reminder_id = await run_db(_insert_reminder, user_id, channel_id, remind_time, message, guild_id)
+    reminder_scheduler.add(reminder_id, remind_time, user_id, channel_id, message, guild_id)
+    return reminder_id
+
+@tasks.loop()
 async def check_reminders():
-    conn = get_db()
-    cursor = conn.cursor()
-    current_time = datetime.now()
-    
-    cursor.execute('SELECT id, user_id, channel_id, message FROM reminders WHERE remind_time <= ?',
-                  (current_time.isoformat(),))
-    reminders = cursor.fetchall()
-    
-    for reminder_id, user_id, channel_id, message in reminders:
+    await reminder_scheduler.run_due()
+
+MUTE_EXPIRY_CONCURRENCY = 10
+MUTE_EXPIRY_PER_GUILD = 2
+
+async def _expire_mute(guild_id, user_id, limit, guild_limit):
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        return
+    # Member edits share a per-guild rate-limit bucket, so take the guild slot before a global one
+    async with guild_limit, limit:
         try:
-            channel = bot.get_channel(int(channel_id))
-            if channel:
-                await channel.send(f"⏰ <@{user_id}> Reminder: {message}")
+            member = guild.get_member(user_id) or await guild.fetch_member(user_id)
+            if member.is_timed_out():
+                await member.timeout(None)
         except:
             pass
-        cursor.execute('DELETE FROM reminders WHERE id = ?', (reminder_id,))
-    
-    conn.commit()
-    conn.close()
+
+def _delete_expired_mutes(cursor, keys, now):
+    cursor.executemany('DELETE FROM mutes WHERE guild_id = ? AND user_id = ? AND muted_until <= ?',
+                       [(guild_id, user_id, now) for guild_id, user_id in keys])
 
 @tasks.loop(minutes=1)
 async def check_mutes():
-    conn = get_db()
-    cursor = conn.cursor()
-    current_time = datetime.now()
-    
-    cursor.execute('SELECT guild_id, user_id FROM mutes WHERE muted_until <= ?',
-                  (current_time.isoformat(),))
-    mutes = cursor.fetchall()
-    
-    for guild_id, user_id in mutes:
-        try:
-            guild = bot.get_guild(int(guild_id))
-            if guild:
-                member = await guild.fetch_member(int(user_id))
-                if member and member.timed_out_until:
-                    await member.timeout(None)
-        except:
-            pass
-        cursor.execute('DELETE FROM mutes WHERE guild_id = ? AND user_id = ?', (guild_id, user_id))
+    now = int(time.time())
+    rows = await db_fetchall('SELECT guild_id, user_id FROM mutes WHERE muted_until <= ?', (now,))
+    # In a cluster each worker lifts only the mutes of guilds on its shards
+    mutes = [(guild_id, user_id) for guild_id, user_id in rows if owns_guild(guild_id)]
+    if not mutes:
+        return
     
-    conn.commit()
-    conn.close()
+    limit = asyncio.Semaphore(MUTE_EXPIRY_CONCURRENCY)
+    guild_limits = {}
+    await asyncio.gather(*(
+        _expire_mute(guild_id, user_id, limit,
+                     guild_limits.setdefault(guild_id, asyncio.Semaphore(MUTE_EXPIRY_PER_GUILD)))
+        for guild_id, user_id in mutes))
+    await run_db(_delete_expired_mutes, mutes, now)
 
 @bot.tree.command(name="rules", description="Display War of Peaks Discord & In-Game Rules")
 async def rules(interaction: discord.Interaction):
@@ -742,13 +2033,9 @@ automod = app_commands.Group(name="automod", description="Auto-moderation system
 @automod.command(name="setup", description="Initialize the auto-moderation system")
 @app_commands.checks.has_permissions(administrator=True)
 async def automod_setup(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''INSERT OR REPLACE INTO automod_settings (guild_id, enabled)
-                   VALUES (?, 1)''', (str(interaction.guild_id),))
-    conn.commit()
-    conn.close()
+    await db_execute('''INSERT OR REPLACE INTO automod_settings (guild_id, enabled)
+                     VALUES (?, 1)''', (interaction.guild_id,))
+    invalidate_automod_config(interaction.guild_id)
     
     embed = discord.Embed(
         title="🛡️ Auto-Moderation Setup Complete",
@@ -760,11 +2047,7 @@ async def automod_setup(interaction: discord.Interaction):
 @automod.command(name="config", description="View auto-moderation configuration")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def automod_config(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM automod_settings WHERE guild_id = ?', (str(interaction.guild_id),))
-    settings = cursor.fetchone()
-    conn.close()
+    settings = await db_fetchone('SELECT * FROM automod_settings WHERE guild_id = ?', (interaction.guild_id,))
     
     if not settings:
         await interaction.response.send_message("❌ Auto-moderation is not set up. Use `/automod setup` first.", ephemeral=True)
@@ -801,9 +2084,6 @@ async def automod_config(interaction: discord.Interaction):
     app_commands.Choice(name="Duplicate", value="duplicate")
 ])
 async def automod_toggle(interaction: discord.Interaction, filter: str, enabled: bool):
-    conn = get_db()
-    cursor = conn.cursor()
-    
     filter_map = {
         "spam": "spam_enabled",
         "links": "links_enabled",
@@ -817,10 +2097,9 @@ async def automod_toggle(interaction: discord.Interaction, filter: str, enabled:
     
     column = filter_map.get(filter)
     if column:
-        cursor.execute(f'UPDATE automod_settings SET {column} = ? WHERE guild_id = ?',
-                      (1 if enabled else 0, str(interaction.guild_id)))
-        conn.commit()
-    conn.close()
+        await db_execute(f'UPDATE automod_settings SET {column} = ? WHERE guild_id = ?',
+                         (1 if enabled else 0, interaction.guild_id))
+        invalidate_automod_config(interaction.guild_id)
     
     status = "enabled" if enabled else "disabled"
     await interaction.response.send_message(f"✅ {filter.capitalize()} filter has been **{status}**.")
@@ -842,8 +2121,12 @@ async def automod_settings(
     mentions_threshold: Optional[int] = None,
     emoji_threshold: Optional[int] = None
 ):
-    conn = get_db()
-    cursor = conn.cursor()
+    values = {"spam_threshold": spam_threshold, "spam_interval": spam_interval, "caps_threshold": caps_threshold,
+              "mentions_threshold": mentions_threshold, "emoji_threshold": emoji_threshold}
+    invalid = [name for name, value in values.items() if value is not None and value < 1]
+    if invalid:
+        await interaction.response.send_message(f"❌ These settings must be at least 1: {', '.join(invalid)}", ephemeral=True)
+        return
     
     updates = []
     if spam_threshold is not None:
@@ -857,12 +2140,13 @@ async def automod_settings(
     if emoji_threshold is not None:
         updates.append(("emoji_threshold", emoji_threshold))
     
-    for column, value in updates:
-        cursor.execute(f'UPDATE automod_settings SET {column} = ? WHERE guild_id = ?',
-                      (value, str(interaction.guild_id)))
+    def apply_updates(cursor):
+        for column, value in updates:
+            cursor.execute(f'UPDATE automod_settings SET {column} = ? WHERE guild_id = ?',
+                          (value, interaction.guild_id))
     
-    conn.commit()
-    conn.close()
+    await run_db(apply_updates)
+    invalidate_automod_config(interaction.guild_id)
     
     await interaction.response.send_message("✅ Auto-moderation settings have been updated!")
 
@@ -876,12 +2160,9 @@ async def automod_settings(
     app_commands.Choice(name="Ban", value="ban")
 ])
 async def automod_punishment(interaction: discord.Interaction, punishment: str):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE automod_settings SET default_punishment = ? WHERE guild_id = ?',
-                  (punishment, str(interaction.guild_id)))
-    conn.commit()
-    conn.close()
+    await db_execute('UPDATE automod_settings SET default_punishment = ? WHERE guild_id = ?',
+                     (punishment, interaction.guild_id))
+    invalidate_automod_config(interaction.guild_id)
     
     await interaction.response.send_message(f"✅ Default punishment set to: **{punishment.upper()}**")
 
@@ -889,38 +2170,29 @@ async def automod_punishment(interaction: discord.Interaction, punishment: str):
 @app_commands.checks.has_permissions(manage_guild=True)
 @app_commands.describe(word="The word to ban")
 async def automod_words_add(interaction: discord.Interaction, word: str):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO automod_banned_words (guild_id, word) VALUES (?, ?)',
-                      (str(interaction.guild_id), word.lower()))
-        conn.commit()
+        await db_execute('INSERT INTO automod_banned_words (guild_id, word) VALUES (?, ?)',
+                         (interaction.guild_id, word.lower()))
+        invalidate_word_matcher(interaction.guild_id)
         await interaction.response.send_message(f"✅ Added `{word}` to banned words list.")
     except sqlite3.IntegrityError:
         await interaction.response.send_message(f"❌ `{word}` is already in the banned words list.", ephemeral=True)
-    conn.close()
 
 @automod.command(name="words_remove", description="Remove a banned word")
 @app_commands.checks.has_permissions(manage_guild=True)
 @app_commands.describe(word="The word to unban")
 async def automod_words_remove(interaction: discord.Interaction, word: str):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM automod_banned_words WHERE guild_id = ? AND word = ?',
-                  (str(interaction.guild_id), word.lower()))
-    conn.commit()
-    conn.close()
+    await db_execute('DELETE FROM automod_banned_words WHERE guild_id = ? AND word = ?',
+                     (interaction.guild_id, word.lower()))
+    invalidate_word_matcher(interaction.guild_id)
     
     await interaction.response.send_message(f"✅ Removed `{word}` from banned words list.")
 
 @automod.command(name="words_list", description="List all banned words")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def automod_words_list(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT word FROM automod_banned_words WHERE guild_id = ?', (str(interaction.guild_id),))
-    words = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    rows = await db_fetchall('SELECT word FROM automod_banned_words WHERE guild_id = ?', (interaction.guild_id,))
+    words = [row[0] for row in rows]
     
     if not words:
         await interaction.response.send_message("📝 No banned words configured.", ephemeral=True)
@@ -933,11 +2205,8 @@ async def automod_words_list(interaction: discord.Interaction):
 @automod.command(name="words_clear", description="Clear all banned words")
 @app_commands.checks.has_permissions(administrator=True)
 async def automod_words_clear(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM automod_banned_words WHERE guild_id = ?', (str(interaction.guild_id),))
-    conn.commit()
-    conn.close()
+    await db_execute('DELETE FROM automod_banned_words WHERE guild_id = ?', (interaction.guild_id,))
+    invalidate_word_matcher(interaction.guild_id)
     
     await interaction.response.send_message("✅ Cleared all banned words.")
 
@@ -945,38 +2214,29 @@ async def automod_words_clear(interaction: discord.Interaction):
 @app_commands.checks.has_permissions(manage_guild=True)
 @app_commands.describe(link="The link domain to whitelist (e.g., youtube.com)")
 async def automod_whitelist_add(interaction: discord.Interaction, link: str):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO automod_whitelist (guild_id, link) VALUES (?, ?)',
-                      (str(interaction.guild_id), link))
-        conn.commit()
+        await db_execute('INSERT INTO automod_whitelist (guild_id, link) VALUES (?, ?)',
+                         (interaction.guild_id, link))
+        invalidate_automod_config(interaction.guild_id)
         await interaction.response.send_message(f"✅ Added `{link}` to whitelist.")
     except sqlite3.IntegrityError:
         await interaction.response.send_message(f"❌ `{link}` is already whitelisted.", ephemeral=True)
-    conn.close()
 
 @automod.command(name="whitelist_remove", description="Remove a whitelisted link")
 @app_commands.checks.has_permissions(manage_guild=True)
 @app_commands.describe(link="The link to remove from whitelist")
 async def automod_whitelist_remove(interaction: discord.Interaction, link: str):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM automod_whitelist WHERE guild_id = ? AND link = ?',
-                  (str(interaction.guild_id), link))
-    conn.commit()
-    conn.close()
+    await db_execute('DELETE FROM automod_whitelist WHERE guild_id = ? AND link = ?',
+                     (interaction.guild_id, link))
+    invalidate_automod_config(interaction.guild_id)
     
     await interaction.response.send_message(f"✅ Removed `{link}` from whitelist.")
 
 @automod.command(name="whitelist_list", description="List all whitelisted links")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def automod_whitelist_list(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT link FROM automod_whitelist WHERE guild_id = ?', (str(interaction.guild_id),))
-    links = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    rows = await db_fetchall('SELECT link FROM automod_whitelist WHERE guild_id = ?', (interaction.guild_id,))
+    links = [row[0] for row in rows]
     
     if not links:
         await interaction.response.send_message("📝 No whitelisted links configured.", ephemeral=True)
@@ -990,45 +2250,34 @@ async def automod_whitelist_list(interaction: discord.Interaction):
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.describe(role="The role to make immune")
 async def automod_immune_role(interaction: discord.Interaction, role: discord.Role):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO automod_immune_roles (guild_id, role_id) VALUES (?, ?)',
-                      (str(interaction.guild_id), str(role.id)))
-        conn.commit()
+        await db_execute('INSERT INTO automod_immune_roles (guild_id, role_id) VALUES (?, ?)',
+                         (interaction.guild_id, role.id))
+        invalidate_automod_config(interaction.guild_id)
         await interaction.response.send_message(f"✅ {role.mention} is now immune to auto-moderation.")
     except sqlite3.IntegrityError:
         await interaction.response.send_message(f"❌ {role.mention} is already immune.", ephemeral=True)
-    conn.close()
 
 @automod.command(name="immune_channel", description="Make a channel immune to auto-moderation")
 @app_commands.checks.has_permissions(administrator=True)
 @app_commands.describe(channel="The channel to make immune")
 async def automod_immune_channel(interaction: discord.Interaction, channel: discord.TextChannel):
-    conn = get_db()
-    cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO automod_immune_channels (guild_id, channel_id) VALUES (?, ?)',
-                      (str(interaction.guild_id), str(channel.id)))
-        conn.commit()
+        await db_execute('INSERT INTO automod_immune_channels (guild_id, channel_id) VALUES (?, ?)',
+                         (interaction.guild_id, channel.id))
+        invalidate_automod_config(interaction.guild_id)
         await interaction.response.send_message(f"✅ {channel.mention} is now immune to auto-moderation.")
     except sqlite3.IntegrityError:
         await interaction.response.send_message(f"❌ {channel.mention} is already immune.", ephemeral=True)
-    conn.close()
 
 @automod.command(name="immune_list", description="List all immune roles and channels")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def automod_immune_list(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT role_id FROM automod_immune_roles WHERE guild_id = ?', (str(interaction.guild_id),))
-    roles = [f"<@&{row[0]}>" for row in cursor.fetchall()]
+    role_rows = await db_fetchall('SELECT role_id FROM automod_immune_roles WHERE guild_id = ?', (interaction.guild_id,))
+    roles = [f"<@&{row[0]}>" for row in role_rows]
     
-    cursor.execute('SELECT channel_id FROM automod_immune_channels WHERE guild_id = ?', (str(interaction.guild_id),))
-    channels = [f"<#{row[0]}>" for row in cursor.fetchall()]
-    
-    conn.close()
+    channel_rows = await db_fetchall('SELECT channel_id FROM automod_immune_channels WHERE guild_id = ?', (interaction.guild_id,))
+    channels = [f"<#{row[0]}>" for row in channel_rows]
     
     embed = discord.Embed(title="🛡️ Auto-Mod Immunity List", color=discord.Color.blue())
     embed.add_field(name="Immune Roles", value="\n".join(roles) if roles else "None", inline=False)
@@ -1047,25 +2296,21 @@ async def automod_immune_remove(interaction: discord.Interaction, role: Optional
         await interaction.response.send_message("❌ Please specify a role or channel.", ephemeral=True)
         return
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
     messages = []
     
     if role:
-        cursor.execute('DELETE FROM automod_immune_roles WHERE guild_id = ? AND role_id = ?',
-                      (str(interaction.guild_id), str(role.id)))
+        await db_execute('DELETE FROM automod_immune_roles WHERE guild_id = ? AND role_id = ?',
+                         (interaction.guild_id, role.id))
         messages.append(f"✅ Removed immunity from {role.mention}.")
     
     if channel:
-        cursor.execute('DELETE FROM automod_immune_channels WHERE guild_id = ? AND channel_id = ?',
-                      (str(interaction.guild_id), str(channel.id)))
+        await db_execute('DELETE FROM automod_immune_channels WHERE guild_id = ? AND channel_id = ?',
+                         (interaction.guild_id, channel.id))
         messages.append(f"✅ Removed immunity from {channel.mention}.")
     
     msg = "\n".join(messages)
     
-    conn.commit()
-    conn.close()
+    invalidate_automod_config(interaction.guild_id)
     
     await interaction.response.send_message(msg)
 
@@ -1073,14 +2318,10 @@ async def automod_immune_remove(interaction: discord.Interaction, role: Optional
 @app_commands.checks.has_permissions(manage_guild=True)
 @app_commands.describe(limit="Number of recent logs to view (default: 10)")
 async def automod_logs(interaction: discord.Interaction, limit: int = 10):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT user_id, violation_type, action_taken, timestamp, details
-                   FROM automod_violations WHERE guild_id = ?
-                   ORDER BY id DESC LIMIT ?''',
-                  (str(interaction.guild_id), min(limit, 25)))
-    logs = cursor.fetchall()
-    conn.close()
+    logs = await db_fetchall('''SELECT user_id, violation_type, action_taken, timestamp, details
+                             FROM automod_violations WHERE guild_id = ?
+                             ORDER BY id DESC LIMIT ?''',
+                             (interaction.guild_id, min(limit, 25)))
     
     if not logs:
         await interaction.response.send_message("📝 No auto-moderation logs found.", ephemeral=True)
@@ -1089,7 +2330,7 @@ async def automod_logs(interaction: discord.Interaction, limit: int = 10):
     embed = discord.Embed(title="📊 Auto-Moderation Logs", color=discord.Color.orange())
     
     for user_id, violation, action, timestamp, details in logs:
-        time_str = datetime.fromisoformat(timestamp).strftime("%Y-%m-%d %H:%M")
+        time_str = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M")
         value = f"**Action:** {action}\n**Time:** {time_str}"
         if details:
             value += f"\n**Details:** {details[:100]}"
@@ -1105,12 +2346,8 @@ async def automod_logs(interaction: discord.Interaction, limit: int = 10):
 @app_commands.checks.has_permissions(manage_guild=True)
 @app_commands.describe(user="The user to reset violations for")
 async def automod_reset(interaction: discord.Interaction, user: discord.Member):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM automod_user_violations WHERE guild_id = ? AND user_id = ?',
-                  (str(interaction.guild_id), str(user.id)))
-    conn.commit()
-    conn.close()
+    await db_execute('DELETE FROM automod_user_violations WHERE guild_id = ? AND user_id = ?',
+                     (interaction.guild_id, user.id))
     
     await interaction.response.send_message(f"✅ Reset violations for {user.mention}.")
 
@@ -1131,14 +2368,10 @@ async def kick(interaction: discord.Interaction, user: discord.Member, reason: O
     
     await user.kick(reason=reason)
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, timestamp)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                 (str(interaction.guild_id), str(user.id), 'kick', reason, 
-                  str(interaction.user.id), datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    await db_execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, timestamp)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                     (interaction.guild_id, user.id, 'kick', reason, 
+                      interaction.user.id, int(time.time())))
     
     embed = discord.Embed(title="👢 Member Kicked", color=discord.Color.orange())
     embed.add_field(name="User", value=user.mention, inline=True)
@@ -1162,14 +2395,10 @@ async def ban(interaction: discord.Interaction, user: discord.Member, reason: Op
     
     await user.ban(reason=reason)
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, timestamp)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                 (str(interaction.guild_id), str(user.id), 'ban', reason, 
-                  str(interaction.user.id), datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    await db_execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, timestamp)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                     (interaction.guild_id, user.id, 'ban', reason, 
+                      interaction.user.id, int(time.time())))
     
     embed = discord.Embed(title="🔨 Member Banned", color=discord.Color.red())
     embed.add_field(name="User", value=str(user), inline=True)
@@ -1196,17 +2425,17 @@ async def mute(interaction: discord.Interaction, user: discord.Member, duration:
     try:
         await user.timeout(timedelta(minutes=duration), reason=reason)
         
-        conn = get_db()
-        cursor = conn.cursor()
-        mute_until = (datetime.now() + timedelta(minutes=duration)).isoformat()
-        cursor.execute('''INSERT OR REPLACE INTO mutes (guild_id, user_id, muted_until)
-                       VALUES (?, ?, ?)''', (str(interaction.guild_id), str(user.id), mute_until))
-        cursor.execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, duration, timestamp)
-                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                     (str(interaction.guild_id), str(user.id), 'mute', reason, 
-                      str(interaction.user.id), f"{duration}m", datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        mute_until = int(time.time()) + duration * 60
+        
+        def record_mute(cursor):
+            cursor.execute('''INSERT OR REPLACE INTO mutes (guild_id, user_id, muted_until)
+                           VALUES (?, ?, ?)''', (interaction.guild_id, user.id, mute_until))
+            cursor.execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, duration, timestamp)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                         (interaction.guild_id, user.id, 'mute', reason, 
+                          interaction.user.id, f"{duration}m", int(time.time())))
+        
+        await run_db(record_mute)
         
         await interaction.response.send_message(f"🔇 Muted {user.mention} for {duration} minutes. Reason: {reason}")
     except:
@@ -1216,14 +2445,10 @@ async def mute(interaction: discord.Interaction, user: discord.Member, duration:
 @app_commands.checks.has_permissions(moderate_members=True)
 @app_commands.describe(user="The member to warn", reason="Reason for warning")
 async def warn(interaction: discord.Interaction, user: discord.Member, reason: Optional[str] = "No reason provided"):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, timestamp)
-                   VALUES (?, ?, ?, ?, ?, ?)''',
-                 (str(interaction.guild_id), str(user.id), 'warn', reason, 
-                  str(interaction.user.id), datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    await db_execute('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, timestamp)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                     (interaction.guild_id, user.id, 'warn', reason, 
+                      interaction.user.id, int(time.time())))
     
     try:
         await user.send(f"⚠️ You have been warned in **{interaction.guild.name}**\nReason: {reason}")
@@ -1316,6 +2541,17 @@ async def poll(interaction: discord.Interaction, question: str, options: str):
     for i in range(len(option_list)):
         await message.add_reaction(reactions[i])
 
+@bot.tree.command(name="remind", description="Set a reminder in this channel")
+@app_commands.describe(minutes="Minutes from now", message="What to remind you about")
+async def remind(interaction: discord.Interaction, minutes: int, message: str):
+    if minutes < 1 or minutes > 525600:
+        await interaction.response.send_message("❌ Minutes must be between 1 and 525600 (one year).", ephemeral=True)
+        return
+
+    await add_reminder(interaction.user.id, interaction.channel_id, int(time.time()) + minutes * 60, message,
+                       interaction.guild_id)
+    await interaction.response.send_message(f"⏰ I'll remind you in {minutes} minute(s): {message}", ephemeral=True)
+
 @bot.tree.command(name="embed", description="Create a custom embed")
 @app_commands.checks.has_permissions(manage_messages=True)
 @app_commands.describe(title="Embed title", description="Embed description", color="Hex color (e.g., #ff0000)")
@@ -1388,6 +2624,25 @@ async def ping(interaction: discord.Interaction):
     embed.add_field(name="Uptime", value=str(uptime).split('.')[0], inline=True)
     await interaction.response.send_message(embed=embed)
 
+@bot.tree.command(name="botstats", description="Show latency statistics for events, commands, database and API calls")
+@app_commands.checks.has_permissions(administrator=True)
+async def botstats(interaction: discord.Interaction):
+    embed = discord.Embed(title="📈 Bot Statistics", color=discord.Color.blue())
+    for family in METRIC_FAMILIES:
+        histograms = metrics[family]
+        if not histograms:
+            continue
+        busiest = sorted(histograms.items(), key=lambda item: item[1].total, reverse=True)[:8]
+        lines = [f"`{label[:32]}` {h.count}× avg {h.total / h.count * 1000:.2f}ms "
+                 f"p50 ≤{h.quantile(0.5) * 1000:g}ms p99 ≤{h.quantile(0.99) * 1000:g}ms"
+                 for label, h in busiest if h.count]
+        if lines:
+            embed.add_field(name=family.replace('_', ' ').title(), value="\n".join(lines)[:1024], inline=False)
+    if not embed.fields:
+        embed.description = "No measurements recorded yet."
+    embed.set_footer(text="Busiest 8 per group by total time; percentiles are bucket upper bounds")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="apply", description="Submit an application to join the alliance")
 async def apply(interaction: discord.Interaction):
     modal = discord.ui.Modal(title="Alliance Application")
@@ -1399,13 +2654,9 @@ async def apply(interaction: discord.Interaction):
     async def modal_callback(modal_interaction: discord.Interaction):
         content = f"**In-game Name:** {modal.children[0].value}\n**Power:** {modal.children[1].value}\n**Reason:** {modal.children[2].value}"
         
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''INSERT INTO applications (guild_id, user_id, content, timestamp)
-                       VALUES (?, ?, ?, ?)''',
-                     (str(interaction.guild_id), str(interaction.user.id), content, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        await db_execute('''INSERT INTO applications (guild_id, user_id, content, timestamp)
+                         VALUES (?, ?, ?, ?)''',
+                         (interaction.guild_id, interaction.user.id, content, int(time.time())))
         
         await modal_interaction.response.send_message("✅ Application submitted! Leadership will review it soon.", ephemeral=True)
     
@@ -1421,13 +2672,9 @@ async def event_add(interaction: discord.Interaction, name: str, date_time: str,
     try:
         event_datetime = datetime.strptime(date_time, "%Y-%m-%d %H:%M")
         
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute('''INSERT INTO events (guild_id, name, datetime, description, created_by)
-                       VALUES (?, ?, ?, ?, ?)''',
-                     (str(interaction.guild_id), name, event_datetime.isoformat(), description, str(interaction.user.id)))
-        conn.commit()
-        conn.close()
+        await db_execute('''INSERT INTO events (guild_id, name, datetime, description, created_by)
+                         VALUES (?, ?, ?, ?, ?)''',
+                         (interaction.guild_id, name, int(event_datetime.timestamp()), description, interaction.user.id))
         
         embed = discord.Embed(title=f"📅 Event Created: {name}", color=discord.Color.green())
         embed.add_field(name="Date & Time", value=event_datetime.strftime("%Y-%m-%d %H:%M"), inline=False)
@@ -1439,14 +2686,10 @@ async def event_add(interaction: discord.Interaction, name: str, date_time: str,
 
 @event_group.command(name="list", description="Show upcoming events")
 async def event_list(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT name, datetime, description FROM events 
-                   WHERE guild_id = ? AND datetime >= ?
-                   ORDER BY datetime LIMIT 10''',
-                 (str(interaction.guild_id), datetime.now().isoformat()))
-    events = cursor.fetchall()
-    conn.close()
+    events = await db_fetchall('''SELECT name, datetime, description FROM events 
+                               WHERE guild_id = ? AND datetime >= ?
+                               ORDER BY datetime LIMIT 10''',
+                               (interaction.guild_id, int(time.time())))
     
     if not events:
         await interaction.response.send_message("📅 No upcoming events scheduled.", ephemeral=True)
@@ -1454,7 +2697,7 @@ async def event_list(interaction: discord.Interaction):
     
     embed = discord.Embed(title="📅 Upcoming Alliance Events", color=discord.Color.blue())
     for name, dt, desc in events:
-        event_dt = datetime.fromisoformat(dt)
+        event_dt = datetime.fromtimestamp(dt)
         embed.add_field(
             name=f"**{name}**",
             value=f"📆 {event_dt.strftime('%Y-%m-%d %H:%M')}\n{desc}",
@@ -1464,6 +2707,74 @@ async def event_list(interaction: discord.Interaction):
 
 bot.tree.add_command(event_group)
 
+customcmd_group = app_commands.Group(name="customcmd", description="Custom ! command management")
+
+@customcmd_group.command(name="add", description="Add or replace a custom ! command")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(name="Command name, used as !name", response="What the bot replies with")
+async def customcmd_add(interaction: discord.Interaction, name: str, response: str):
+    name = name[1:] if name.startswith("!") else name
+    if not name or any(c.isspace() for c in name):
+        await interaction.response.send_message("❌ Command names must be a single word.", ephemeral=True)
+        return
+    
+    await save_custom_command(interaction.guild_id, name, response, interaction.user.id)
+    await interaction.response.send_message(f"✅ Saved custom command `!{name}`.", ephemeral=True)
+
+@customcmd_group.command(name="remove", description="Remove a custom ! command")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(name="Command name to remove")
+async def customcmd_remove(interaction: discord.Interaction, name: str):
+    name = name[1:] if name.startswith("!") else name
+    if await delete_custom_command(interaction.guild_id, name):
+        await interaction.response.send_message(f"✅ Removed custom command `!{name}`.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"❌ No custom command named `!{name}`.", ephemeral=True)
+
+@customcmd_group.command(name="list", description="List this server's custom ! commands")
+async def customcmd_list(interaction: discord.Interaction):
+    names = sorted(await get_custom_commands(interaction.guild_id))
+    if not names:
+        await interaction.response.send_message("📝 No custom commands yet.", ephemeral=True)
+        return
+    
+    listing = ", ".join(f"`!{name}`" for name in names)
+    await interaction.response.send_message(f"📝 **Custom commands:** {listing}"[:2000], ephemeral=True)
+
+bot.tree.add_command(customcmd_group)
+
+settings_group = app_commands.Group(name="settings", description="Server bot settings")
+
+@settings_group.command(name="logchannel", description="Set the channel for server logs")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(channel="Channel to send logs to")
+async def settings_logchannel(interaction: discord.Interaction, channel: discord.TextChannel):
+    await update_guild_settings(interaction.guild_id, log_channel_id=channel.id)
+    await interaction.response.send_message(f"✅ Logs will be sent to {channel.mention}.", ephemeral=True)
+
+@settings_group.command(name="welcome", description="Set the welcome channel and message")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(channel="Channel for welcome messages", message="Message; {user} and {server} are replaced")
+async def settings_welcome(interaction: discord.Interaction, channel: discord.TextChannel, message: str):
+    await update_guild_settings(interaction.guild_id, welcome_channel_id=channel.id, welcome_message=message)
+    await interaction.response.send_message(f"✅ Welcome messages will be sent to {channel.mention}.", ephemeral=True)
+
+@settings_group.command(name="goodbye", description="Set the goodbye channel and message")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(channel="Channel for goodbye messages", message="Message; {user} and {server} are replaced")
+async def settings_goodbye(interaction: discord.Interaction, channel: discord.TextChannel, message: str):
+    await update_guild_settings(interaction.guild_id, goodbye_channel_id=channel.id, goodbye_message=message)
+    await interaction.response.send_message(f"✅ Goodbye messages will be sent to {channel.mention}.", ephemeral=True)
+
+@settings_group.command(name="leveling", description="Enable or disable message XP")
+@app_commands.checks.has_permissions(manage_guild=True)
+@app_commands.describe(enabled="Whether members earn XP from messages")
+async def settings_leveling(interaction: discord.Interaction, enabled: bool):
+    await update_guild_settings(interaction.guild_id, leveling_enabled=1 if enabled else 0)
+    await interaction.response.send_message(f"✅ Leveling {'enabled' if enabled else 'disabled'}.", ephemeral=True)
+
+bot.tree.add_command(settings_group)
+
 @bot.tree.command(name="namecheck", description="Check if members have proper alliance tags")
 @app_commands.checks.has_permissions(manage_guild=True)
 async def namecheck(interaction: discord.Interaction):
@@ -1486,18 +2797,15 @@ async def namecheck(interaction: discord.Interaction):
 
 @bot.tree.command(name="stats", description="View your server stats")
 async def stats(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT xp, level FROM user_levels WHERE guild_id = ? AND user_id = ?',
-                  (str(interaction.guild_id), str(interaction.user.id)))
-    result = cursor.fetchone()
-    
-    cursor.execute('SELECT COUNT(*) FROM infractions WHERE guild_id = ? AND user_id = ? AND type = ?',
-                  (str(interaction.guild_id), str(interaction.user.id), 'warn'))
-    warns = cursor.fetchone()[0]
+    record = xp_records.get((interaction.guild_id, interaction.user.id))
+    if record:
+        result = (record.xp, record.level)
+    else:
+        result = await db_fetchone('SELECT xp, level FROM user_levels WHERE guild_id = ? AND user_id = ?',
+                                   (interaction.guild_id, interaction.user.id))
     
-    conn.close()
+    warns = (await db_fetchone('SELECT COUNT(*) FROM infractions WHERE guild_id = ? AND user_id = ? AND type = ?',
+                               (interaction.guild_id, interaction.user.id, 'warn')))[0]
     
     xp, level = result if result else (0, 0)
     
@@ -1506,86 +2814,89 @@ async def stats(interaction: discord.Interaction):
     embed.add_field(name="Level", value=level, inline=True)
     embed.add_field(name="XP", value=xp, inline=True)
     embed.add_field(name="Warnings", value=warns, inline=True)
+    if result:
+        board = await get_leaderboard(interaction.guild_id)
+        embed.add_field(name="Rank", value=f"#{board.rank_of(xp)} of {len(board)}", inline=True)
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="rank", description="View the server leaderboard")
-async def rank(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT user_id, xp, level FROM user_levels 
-                   WHERE guild_id = ? ORDER BY xp DESC LIMIT 10''',
-                 (str(interaction.guild_id),))
-    top_users = cursor.fetchall()
-    conn.close()
+@app_commands.describe(page="Leaderboard page to view (default: 1)")
+async def rank(interaction: discord.Interaction, page: Optional[int] = 1):
+    board = await get_leaderboard(interaction.guild_id)
+    pages = max(1, -(-len(board) // LEADERBOARD_PAGE_SIZE))
+    if page < 1 or page > pages:
+        await interaction.response.send_message(f"❌ Page must be between 1 and {pages}.", ephemeral=True)
+        return
+    
+    await flush_pending_xp()
+    offset = (page - 1) * LEADERBOARD_PAGE_SIZE
+    top_users = await db_fetchall('''SELECT user_id, xp, level FROM user_levels 
+                                  WHERE guild_id = ? ORDER BY xp DESC LIMIT ? OFFSET ?''',
+                                  (interaction.guild_id, LEADERBOARD_PAGE_SIZE, offset))
     
     if not top_users:
         await interaction.response.send_message("📊 No leaderboard data yet.", ephemeral=True)
         return
     
     embed = discord.Embed(title="🏆 Server Leaderboard", color=discord.Color.gold())
-    medals = ['🥇', '🥈', '🥉'] + ['📊'] * 7
+    medals = ['🥇', '🥈', '🥉']
     
-    for i, (user_id, xp, level) in enumerate(top_users):
-        user = interaction.guild.get_member(int(user_id))
+    for i, (user_id, xp, level) in enumerate(top_users, start=offset + 1):
+        user = interaction.guild.get_member(user_id)
         name = user.display_name if user else f"User {user_id}"
+        medal = medals[i - 1] if i <= len(medals) else '📊'
         embed.add_field(
-            name=f"{medals[i]} #{i+1} {name}",
+            name=f"{medal} #{i} {name}",
             value=f"Level {level} • {xp} XP",
             inline=False
         )
+    embed.set_footer(text=f"Page {page} of {pages} • {len(board)} ranked members")
     
     await interaction.response.send_message(embed=embed)
 
-@bot.tree.command(name="daily", description="Claim your daily coins")
-async def daily(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    
+def _claim_daily(cursor, guild_id, user_id):
+    """Claim the daily reward; return (reward, new_balance) or (None, time_left) while on cooldown"""
     cursor.execute('SELECT balance, last_daily FROM economy WHERE guild_id = ? AND user_id = ?',
-                  (str(interaction.guild_id), str(interaction.user.id)))
+                  (guild_id, user_id))
     result = cursor.fetchone()
     
-    now = datetime.now()
-    can_claim = True
+    now = int(time.time())
     
-    if result and result[1]:
-        last_daily = datetime.fromisoformat(result[1])
-        if (now - last_daily).total_seconds() < 86400:
-            time_left = timedelta(seconds=86400 - (now - last_daily).total_seconds())
-            await interaction.response.send_message(
-                f"⏰ You already claimed your daily! Come back in {str(time_left).split('.')[0]}", 
-                ephemeral=True
-            )
-            can_claim = False
-    
-    if can_claim:
-        reward = random.randint(100, 250)
-        if result:
-            new_balance = result[0] + reward
-            cursor.execute('''UPDATE economy SET balance = ?, last_daily = ? 
-                           WHERE guild_id = ? AND user_id = ?''',
-                         (new_balance, now.isoformat(), str(interaction.guild_id), str(interaction.user.id)))
-        else:
-            new_balance = reward
-            cursor.execute('''INSERT INTO economy (guild_id, user_id, balance, last_daily)
-                           VALUES (?, ?, ?, ?)''',
-                         (str(interaction.guild_id), str(interaction.user.id), reward, now.isoformat()))
-        
-        conn.commit()
-        await interaction.response.send_message(f"💰 Daily reward claimed! You received **{reward} coins**. New balance: **{new_balance} coins**")
+    if result and result[1] and now - result[1] < 86400:
+        return None, timedelta(seconds=86400 - (now - result[1]))
     
-    conn.close()
+    reward = random.randint(100, 250)
+    if result:
+        new_balance = result[0] + reward
+        cursor.execute('''UPDATE economy SET balance = ?, last_daily = ? 
+                       WHERE guild_id = ? AND user_id = ?''',
+                     (new_balance, now, guild_id, user_id))
+    else:
+        new_balance = reward
+        cursor.execute('''INSERT INTO economy (guild_id, user_id, balance, last_daily)
+                       VALUES (?, ?, ?, ?)''',
+                     (guild_id, user_id, reward, now))
+    return reward, new_balance
+
+@bot.tree.command(name="daily", description="Claim your daily coins")
+async def daily(interaction: discord.Interaction):
+    reward, result = await run_db(_claim_daily, interaction.guild_id, interaction.user.id)
+    
+    if reward is None:
+        await interaction.response.send_message(
+            f"⏰ You already claimed your daily! Come back in {str(result).split('.')[0]}", 
+            ephemeral=True
+        )
+        return
+    
+    await interaction.response.send_message(f"💰 Daily reward claimed! You received **{reward} coins**. New balance: **{result} coins**")
 
 @bot.tree.command(name="balance", description="Check your coin balance")
 async def balance(interaction: discord.Interaction, user: Optional[discord.Member] = None):
     target = user or interaction.user
     
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT balance FROM economy WHERE guild_id = ? AND user_id = ?',
-                  (str(interaction.guild_id), str(target.id)))
-    result = cursor.fetchone()
-    conn.close()
+    result = await db_fetchone('SELECT balance FROM economy WHERE guild_id = ? AND user_id = ?',
+                               (interaction.guild_id, target.id))
     
     bal = result[0] if result else 0
     await interaction.response.send_message(f"💰 **{target.display_name}** has **{bal} coins**")
@@ -1613,12 +2924,8 @@ async def duel(interaction: discord.Interaction, opponent: discord.Member):
 
 @bot.tree.command(name="quote", description="Get a random quote")
 async def get_quote(interaction: discord.Interaction):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT quote, author FROM quotes WHERE guild_id = ? ORDER BY RANDOM() LIMIT 1',
-                  (str(interaction.guild_id),))
-    result = cursor.fetchone()
-    conn.close()
+    result = await db_fetchone('SELECT quote, author FROM quotes WHERE guild_id = ? ORDER BY RANDOM() LIMIT 1',
+                               (interaction.guild_id,))
     
     if result:
         quote, author = result
@@ -1663,10 +2970,14 @@ async def eightball(interaction: discord.Interaction, question: str):
     embed.add_field(name="Answer", value=random.choice(responses), inline=False)
     await interaction.response.send_message(embed=embed)
 
-TOKEN = os.getenv('DISCORD_TOKEN')
-if not TOKEN:
-    print("❌ Error: DISCORD_TOKEN environment variable not found!")
-    print("Please add your Discord bot token to Secrets with key 'DISCORD_TOKEN'")
-    exit(1)
+if __name__ == "__main__":
+    TOKEN = os.getenv('DISCORD_TOKEN')
+    if not TOKEN:
+        print("❌ Error: DISCORD_TOKEN environment variable not found!")
+        print("Please add your Discord bot token to Secrets with key 'DISCORD_TOKEN'")
+        exit(1)
 
-bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        flush_pending_xp_sync()
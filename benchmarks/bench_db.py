@@ -0,0 +1,84 @@
+"""Benchmark the bot's database access patterns.
+
+Compares the old connect-per-call pattern on a rollback-journal database
+with the long-lived, WAL-mode connection returned by Main.get_db(), using
+query strings the bot actually issues.
+
+    python benchmarks/bench_db.py
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('CHRISBOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import Main
+
+GUILDS = 50
+USERS = 2000
+OPERATIONS = 5000
+
+READ_QUERY = 'SELECT xp, level, last_xp_time FROM user_levels WHERE guild_id = ? AND user_id = ?'
+WRITE_QUERY = '''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, timestamp)
+                 VALUES (?, ?, ?, ?, ?, ?)'''
+
+def seed(conn):
+    conn.executemany('INSERT OR REPLACE INTO user_levels (guild_id, user_id, xp, level, last_xp_time) VALUES (?, ?, ?, ?, ?)',
+                     ((g, u, u, 0, 1704067200) for g in range(GUILDS) for u in range(USERS)))
+    conn.commit()
+
+def read_params(i):
+    return (i % GUILDS, i % USERS)
+
+def write_params(i):
+    return (i % GUILDS, i % USERS, 'warn', 'bench', 1, 1704067200)
+
+def connect_per_call(path, query, params, write):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    if write:
+        conn.commit()
+    else:
+        cursor.fetchone()
+    conn.close()
+
+def persistent(conn, query, params, write):
+    cursor = conn.execute(query, params)
+    if write:
+        conn.commit()
+    else:
+        cursor.fetchone()
+
+def measure(run, query, make_params, write):
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        run(query, make_params(i), write)
+    return OPERATIONS / (time.perf_counter() - start)
+
+def main():
+    legacy_path = os.path.join(tempfile.mkdtemp(), 'legacy.db')
+    Main.DB_FILE = legacy_path
+    Main.init_database()
+    legacy = sqlite3.connect(legacy_path)
+    seed(legacy)
+    legacy.close()
+
+    Main.DB_FILE = os.environ['CHRISBOT_DB']
+    conn = Main.get_db()
+    seed(conn)
+
+    print(f"{'workload':<10} {'connect-per-call q/s':>22} {'persistent WAL q/s':>20} {'speedup':>8}")
+    for name, query, make_params, write in (
+        ('read', READ_QUERY, read_params, False),
+        ('write', WRITE_QUERY, write_params, True),
+    ):
+        old = measure(lambda q, p, w: connect_per_call(legacy_path, q, p, w), query, make_params, write)
+        new = measure(lambda q, p, w: persistent(conn, q, p, w), query, make_params, write)
+        print(f"{name:<10} {old:>22.0f} {new:>20.0f} {new / old:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark the /rank and /stats leaderboard lookups on one large guild.
+
+Fills user_levels with 500k members of a single guild, then compares the old
+unindexed `ORDER BY xp DESC LIMIT 10` (forced onto the primary key so SQLite
+has to sort) with the (guild_id, xp DESC) index, and a per-call COUNT rank
+with the in-memory GuildLeaderboard.
+
+    python benchmarks/bench_leaderboard.py
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('CHRISBOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import Main
+
+GUILD_ID = 100000000000000000
+ROWS = 500_000
+LOOKUPS = 200
+
+OLD_TOP = '''SELECT user_id, xp, level FROM user_levels INDEXED BY sqlite_autoindex_user_levels_1
+             WHERE guild_id = ? ORDER BY xp DESC LIMIT 10'''
+NEW_PAGE = '''SELECT user_id, xp, level FROM user_levels
+              WHERE guild_id = ? ORDER BY xp DESC LIMIT 10 OFFSET ?'''
+COUNT_RANK = 'SELECT COUNT(*) FROM user_levels WHERE guild_id = ? AND xp > ?'
+
+def fill(conn, rng):
+    conn.execute('DELETE FROM user_levels')
+    conn.executemany('INSERT INTO user_levels (guild_id, user_id, xp, level) VALUES (?, ?, ?, ?)',
+                     ((GUILD_ID, 200000000000000000 + i, xp, xp // 100)
+                      for i, xp in enumerate(rng.randint(0, 1_000_000) for _ in range(ROWS))))
+    conn.commit()
+    conn.execute('ANALYZE')
+
+def time_ms(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    rng = random.Random(42)
+    conn = Main.get_db()
+    fill(conn, rng)
+    probes = [rng.randint(0, 1_000_000) for _ in range(LOOKUPS)]
+
+    start = time.perf_counter()
+    rows = conn.execute('SELECT user_id, xp FROM user_levels WHERE guild_id = ?', (GUILD_ID,)).fetchall()
+    board = Main.GuildLeaderboard(xp for _, xp in rows)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    results = [
+        ('top 10, unindexed sort', time_ms(lambda: conn.execute(OLD_TOP, (GUILD_ID,)).fetchall(), 3)),
+        ('top 10, xp index', time_ms(lambda: conn.execute(NEW_PAGE, (GUILD_ID, 0)).fetchall(), 20)),
+        ('page 100, xp index', time_ms(lambda: conn.execute(NEW_PAGE, (GUILD_ID, 990)).fetchall(), 20)),
+        ('rank, COUNT on index', time_ms(lambda: [conn.execute(COUNT_RANK, (GUILD_ID, xp)).fetchone()
+                                                  for xp in probes], 1) / LOOKUPS),
+        ('rank, GuildLeaderboard', time_ms(lambda: [board.rank_of(xp) for xp in probes], 20) / LOOKUPS),
+        ('leaderboard update', time_ms(lambda: [board.update(xp, xp + 20) for xp in probes], 1) / LOOKUPS),
+    ]
+
+    print(f"{ROWS} rows, leaderboard load {load_ms:.0f} ms")
+    print(f"{'lookup':<24} {'ms/call':>10}")
+    for name, ms in results:
+        print(f"{name:<24} {ms:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare per-event log sends with the batched LogDispatcher under a burst.
+
+Fires a burst of log_event() calls at one guild whose log channel accepts one
+message at a time, SEND_LATENCY seconds each (a stand-in for the channel's
+rate-limit bucket), and counts REST sends, database round trips and the time
+until every embed has been delivered.
+
+    python benchmarks/bench_log_batching.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('CHRISBOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import discord
+import Main
+
+GUILD_ID = 100000000000000000
+CHANNEL_ID = 200000000000000000
+BURST = 500
+SEND_LATENCY = 0.02
+
+class CountingChannel:
+    id = CHANNEL_ID
+
+    def __init__(self):
+        self.sends = 0
+        self.embeds = 0
+        self.bucket = asyncio.Lock()
+
+    async def send(self, embed=None, embeds=None):
+        async with self.bucket:
+            await asyncio.sleep(SEND_LATENCY)
+        self.sends += 1
+        self.embeds += len(embeds) if embeds else 1
+
+def make_embed(i):
+    embed = discord.Embed(title="📥 Member Joined", description=f"<@{i}> joined the server")
+    embed.add_field(name="User", value=f"user#{i}")
+    return embed
+
+def _legacy_load_log_target(cursor, guild_id, event_type):
+    cursor.execute('SELECT log_channel_id FROM guild_settings WHERE guild_id = ?', (guild_id,))
+    result = cursor.fetchone()
+    if not result or not result[0]:
+        return None
+    cursor.execute('SELECT enabled FROM log_events WHERE guild_id = ? AND event_type = ?', (guild_id, event_type))
+    event_check = cursor.fetchone()
+    if event_check and event_check[0] != 1:
+        return None
+    return result[0]
+
+async def legacy_log_event(guild_id, event_type, embed):
+    channel_id = await Main.run_db(_legacy_load_log_target, guild_id, event_type)
+    if channel_id:
+        channel = Main.bot.get_channel(channel_id)
+        if channel:
+            await channel.send(embed=embed)
+
+async def burst(log_event, channel):
+    db_calls = 0
+    run_db = Main.run_db
+
+    async def counting_run_db(func, *args):
+        nonlocal db_calls
+        db_calls += 1
+        return await run_db(func, *args)
+
+    Main.run_db = counting_run_db
+    Main.guild_settings_cache.clear()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(log_event(GUILD_ID, 'member_join', make_embed(i)) for i in range(BURST)))
+        while channel.embeds < BURST:
+            await asyncio.sleep(0.005)
+    finally:
+        Main.run_db = run_db
+    return channel.sends, db_calls, time.perf_counter() - start
+
+async def run(log_event):
+    channel = CountingChannel()
+    Main.bot.get_channel = lambda channel_id: channel
+    return await burst(log_event, channel)
+
+def main():
+    conn = Main.get_db()
+    conn.execute('INSERT OR REPLACE INTO guild_settings (guild_id, log_channel_id) VALUES (?, ?)', (GUILD_ID, CHANNEL_ID))
+    conn.commit()
+
+    print(f"{BURST}-event burst, {SEND_LATENCY * 1000:.0f} ms per send")
+    print(f"{'':<12} {'REST sends':>10} {'DB calls':>9} {'delivered s':>12}")
+    for name, log_event in (('per-event', legacy_log_event), ('batched', Main.log_event)):
+        sends, db_calls, seconds = asyncio.run(run(log_event))
+        print(f"{name:<12} {sends:>10} {db_calls:>9} {seconds:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Measure reminder delivery lateness with a large pending backlog.
+
+Seeds 100k reminders spread over the next day plus a handful due in the
+next few seconds, adds more through add_reminder() while the scheduler
+sleeps, and reports how late each one was delivered.
+
+    python benchmarks/bench_reminders.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('CHRISBOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import Main
+
+PENDING = 100_000
+SOON = 20
+RUN_SECONDS = 9
+
+class RecordingChannel:
+    def __init__(self):
+        self.delivered = []
+
+    async def send(self, content):
+        self.delivered.append((content, time.time()))
+
+async def run(channel):
+    rng = random.Random(42)
+    now = int(time.time())
+    due = {}
+    rows = [(rng.getrandbits(60), 1, now + rng.randint(60, 86400), 'later', now) for _ in range(PENDING)]
+    for i in range(SOON):
+        due[f'soon {i}'] = now + 3 + i % 4
+        rows.append((rng.getrandbits(60), 1, due[f'soon {i}'], f'soon {i}', now))
+    Main.get_db().executemany('''INSERT INTO reminders (user_id, channel_id, remind_time, message, created_at)
+                              VALUES (?, ?, ?, ?, ?)''', rows)
+    Main.get_db().commit()
+
+    start = time.perf_counter()
+    await Main.reminder_scheduler.load(time.time())
+    load_ms = (time.perf_counter() - start) * 1000
+    loaded = len(Main.reminder_scheduler.heap)
+
+    async def add_later():
+        for i in range(SOON):
+            await asyncio.sleep(0.1)
+            due[f'added {i}'] = int(time.time()) + 2
+            await Main.add_reminder(1, 1, due[f'added {i}'], f'added {i}')
+
+    async def scheduler():
+        while True:
+            await Main.reminder_scheduler.run_due()
+
+    adder = asyncio.ensure_future(add_later())
+    task = asyncio.ensure_future(scheduler())
+    await asyncio.sleep(RUN_SECONDS)
+    task.cancel()
+    await adder
+
+    lateness = sorted(sent - due[content.split('Reminder: ')[1]] for content, sent in channel.delivered)
+    print(f"{PENDING} pending, heap load {load_ms:.0f} ms ({loaded} within the horizon)")
+    print(f"delivered {len(lateness)}/{len(due)}, lateness ms: "
+          f"min {lateness[0] * 1000:.1f}, median {lateness[len(lateness) // 2] * 1000:.1f}, max {lateness[-1] * 1000:.1f}")
+
+def main():
+    channel = RecordingChannel()
+    Main.bot.get_channel = lambda channel_id: channel
+    asyncio.run(run(channel))
+
+if __name__ == "__main__":
+    main()
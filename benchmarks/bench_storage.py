@@ -0,0 +1,118 @@
+"""Compare the TEXT/ISO-8601 storage layout with INTEGER snowflakes and epoch times.
+
+Builds a realistic database in the schema-version-1 layout (every Discord ID
+as TEXT, every time as an ISO string), migrates a copy in place to the current
+INTEGER layout, and reports file size and hot-query timings for both.
+
+    python benchmarks/bench_storage.py
+"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('CHRISBOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import Main
+
+GUILDS = 20
+MEMBERS_PER_GUILD = 10_000
+INFRACTIONS = 100_000
+VIOLATIONS = 200_000
+MUTES = 5_000
+LOOKUPS = 5_000
+BASE_SNOWFLAKE = 1_100_000_000_000_000_000
+NOW = 1_760_000_000
+
+def snowflake(rng):
+    return BASE_SNOWFLAKE + rng.getrandbits(56)
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch).isoformat()
+
+def fill_legacy(path, rng):
+    guilds = [snowflake(rng) for _ in range(GUILDS)]
+    members = [(g, snowflake(rng)) for g in guilds for _ in range(MEMBERS_PER_GUILD)]
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO user_levels VALUES (?, ?, ?, ?, ?)',
+                     ((str(g), str(u), rng.randint(0, 50_000), rng.randint(0, 20), iso(NOW - rng.randint(0, 10**7)))
+                      for g, u in members))
+    conn.executemany('INSERT INTO economy VALUES (?, ?, ?, ?)',
+                     ((str(g), str(u), rng.randint(0, 10_000), iso(NOW - rng.randint(0, 10**6))) for g, u in members))
+    conn.executemany('''INSERT INTO infractions (guild_id, user_id, type, reason, moderator_id, duration, timestamp)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     ((str(g), str(u), rng.choice(('warn', 'kick', 'mute')), 'Spamming', str(snowflake(rng)), None,
+                       iso(NOW - rng.randint(0, 10**7))) for g, u in rng.choices(members, k=INFRACTIONS)))
+    conn.executemany('''INSERT INTO automod_violations (guild_id, user_id, violation_type, action_taken, timestamp, details)
+                     VALUES (?, ?, ?, ?, ?, ?)''',
+                     ((str(g), str(u), 'spam', 'deleted', iso(NOW - rng.randint(0, 10**7)), '')
+                      for g, u in rng.choices(members, k=VIOLATIONS)))
+    conn.executemany('INSERT OR REPLACE INTO mutes VALUES (?, ?, ?)',
+                     ((str(g), str(u), iso(NOW + rng.randint(-3600, 3600))) for g, u in rng.choices(members, k=MUTES)))
+    conn.commit()
+    conn.close()
+    return members
+
+def vacuum_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute('VACUUM')
+    conn.close()
+    return os.path.getsize(path)
+
+def time_us(conn, query, make_params, convert=None):
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        row = conn.execute(query, make_params(i)).fetchone()
+        if convert:
+            convert(row)
+    return (time.perf_counter() - start) / LOOKUPS * 1e6
+
+def main():
+    rng = random.Random(42)
+    workdir = tempfile.mkdtemp()
+    legacy_path = os.path.join(workdir, 'legacy.db')
+    current_path = os.path.join(workdir, 'current.db')
+
+    Main.init_database(legacy_path, target=1)
+    members = fill_legacy(legacy_path, rng)
+    shutil.copy(legacy_path, current_path)
+
+    start = time.perf_counter()
+    Main.init_database(current_path)
+    migrate_s = time.perf_counter() - start
+
+    legacy_size = vacuum_size(legacy_path)
+    current_size = vacuum_size(current_path)
+
+    probes = rng.choices(members, k=LOOKUPS)
+    cutoff = NOW
+    legacy = sqlite3.connect(legacy_path)
+    current = sqlite3.connect(current_path)
+    workloads = (
+        ('xp row + parse', 'SELECT xp, level, last_xp_time FROM user_levels WHERE guild_id = ? AND user_id = ?',
+         lambda db, i: (str(probes[i][0]), str(probes[i][1])) if db is legacy else probes[i],
+         lambda db: (lambda row: datetime.fromisoformat(row[2])) if db is legacy else None),
+        ('warn count', 'SELECT COUNT(*) FROM infractions WHERE guild_id = ? AND user_id = ? AND type = ?',
+         lambda db, i: (str(probes[i][0]), str(probes[i][1]), 'warn') if db is legacy else probes[i] + ('warn',),
+         lambda db: None),
+        ('due mutes', 'SELECT COUNT(*) FROM mutes WHERE muted_until <= ?',
+         lambda db, i: (iso(cutoff),) if db is legacy else (cutoff,),
+         lambda db: None),
+    )
+
+    print(f"migration: {migrate_s:.1f} s")
+    print(f"{'':<16} {'TEXT/ISO':>12} {'INTEGER':>12} {'change':>8}")
+    print(f"{'file size MB':<16} {legacy_size / 1e6:>12.1f} {current_size / 1e6:>12.1f} "
+          f"{current_size / legacy_size - 1:>+8.0%}")
+    for name, query, make_params, convert in workloads:
+        old = time_us(legacy, query, lambda i: make_params(legacy, i), convert(legacy))
+        new = time_us(current, query, lambda i: make_params(current, i), convert(current))
+        print(f"{name + ' us':<16} {old:>12.2f} {new:>12.2f} {new / old - 1:>+8.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Benchmark the banned-word filter against growing word lists.
+
+Compares the old per-word `word in content_lower` loop with the compiled
+WordMatcher automaton. Per-message cost of the matcher should stay flat
+from 10 up to 50k banned words.
+
+    python benchmarks/bench_word_filter.py
+"""
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('CHRISBOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+from Main import WordMatcher
+
+WORD_COUNTS = [10, 100, 1000, 10000, 50000]
+MESSAGES = 200
+MESSAGE_LENGTH = 400
+
+def random_word(rng):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12)))
+
+def random_message(rng):
+    words = []
+    while sum(len(w) + 1 for w in words) < MESSAGE_LENGTH:
+        words.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 8))))
+    return ' '.join(words)[:MESSAGE_LENGTH]
+
+def time_per_message(check, messages, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in messages:
+            check(content)
+        best = min(best, time.perf_counter() - start)
+    return best / len(messages) * 1e6
+
+def main():
+    rng = random.Random(42)
+    messages = [random_message(rng) for _ in range(MESSAGES)]
+
+    print(f"{'words':>8} {'build ms':>10} {'matcher us/msg':>15} {'loop us/msg':>12}")
+    for count in WORD_COUNTS:
+        words = [random_word(rng) for _ in range(count)]
+
+        start = time.perf_counter()
+        matcher = WordMatcher(words)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        matcher_us = time_per_message(matcher.search, messages)
+        loop_us = time_per_message(lambda content: next((w for w in words if w in content), None),
+                                   messages, repeat=1)
+        print(f"{count:>8} {build_ms:>10.1f} {matcher_us:>15.1f} {loop_us:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+"""Offline benchmark harness for the message hot path.
+
+Pushes synthetic message streams through on_message (auto-moderation,
+leveling and custom-command dispatch) using lightweight fake guilds, members,
+channels and messages against a temporary database, with no Discord
+connection. Each scenario reports throughput, per-message latency, database
+round trips and SQL statements per message, and REST calls per message.
+
+Each message carries a timestamp in scenario time. While a scenario runs, the
+bot reads the time from a simulated clock, set to each message's timestamp
+as the message is delivered. Spam windows, XP cooldowns and cache lifetimes
+therefore see the pace of the scenario, not how fast the harness can push
+messages, and the XP flush runs every XP_FLUSH_INTERVAL of scenario time.
+Scenarios mark the messages that break a rule. The report shows how many
+messages were deleted, how many of those broke no rule, and how many levels
+members gained.
+
+Background work a message causes (enforcement, log batches, the XP flush) is
+waited for after the stream and counted in the per-message totals, but not in
+the latency or throughput figures.
+
+Results are written as JSON so runs can be compared:
+
+    python benchmarks/harness.py
+    python benchmarks/harness.py --scenario spam_wave --concurrency 20
+    python benchmarks/harness.py --compare benchmarks/results/baseline.json
+
+Prefix commands are not part of the harness: bot.process_commands is replaced
+with a no-op because the bot registers none.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('CHRISBOT_DB', os.path.join(tempfile.mkdtemp(), 'bench.db'))
+
+import Main
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+BOT_USER_ID = 900000000000000000
+LOG_CHANNEL_ID = 800000000000000000
+
+CHAT_RATE = 2.0
+SPAM_BURST = 25
+SPAM_GAP = 0.5
+SPAM_INTERVAL = 5
+
+class SimulatedClock:
+    """Stands in for Main's time module; monotonic() and time() advance only when now is set"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.wall_origin = time.time()
+        self.monotonic_origin = time.monotonic()
+
+    def monotonic(self):
+        return self.monotonic_origin + self.now
+
+    def time(self):
+        return self.wall_origin + self.now
+
+    def __getattr__(self, name):
+        # perf_counter, strftime and the rest stay real
+        return getattr(time, name)
+
+class FakeRest:
+    """Counts REST calls made through the fakes and optionally delays each one"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = True
+        self.mention = f"<@{user_id}>"
+
+class FakeRole:
+    def __init__(self, role_id):
+        self.id = role_id
+        self.mention = f"<@&{role_id}>"
+
+class FakeChannel:
+    def __init__(self, channel_id, rest):
+        self.id = channel_id
+        self.mention = f"<#{channel_id}>"
+        self.rest = rest
+
+    async def send(self, content=None, embed=None, embeds=None):
+        await self.rest.call()
+
+class FakeAvatar:
+    url = "https://cdn.discordapp.com/embed/avatars/0.png"
+
+class FakeMember:
+    created_at = datetime(2020, 1, 1)
+    display_avatar = FakeAvatar()
+
+    def __init__(self, member_id, guild, rest):
+        self.id = member_id
+        self.guild = guild
+        self.bot = False
+        self.roles = []
+        self.mention = f"<@{member_id}>"
+        self.display_name = f"member{member_id}"
+        self.rest = rest
+
+    async def send(self, content=None, embed=None):
+        await self.rest.call()
+
+    async def timeout(self, duration, reason=None):
+        await self.rest.call()
+
+    async def kick(self, reason=None):
+        await self.rest.call()
+
+    async def ban(self, reason=None):
+        await self.rest.call()
+
+    async def add_roles(self, *roles, reason=None, atomic=True):
+        await self.rest.call()
+
+    async def remove_roles(self, *roles, reason=None, atomic=True):
+        await self.rest.call()
+
+    def __str__(self):
+        return self.display_name
+
+class FakeGuild:
+    def __init__(self, guild_id, member_count, rest):
+        self.id = guild_id
+        self.name = f"guild{guild_id}"
+        self.rest = rest
+        self.members = [FakeMember(guild_id + 1000 + i, self, rest) for i in range(member_count)]
+        self.by_id = {member.id: member for member in self.members}
+        self.text_channel = FakeChannel(guild_id + 1, rest)
+
+    def get_member(self, member_id):
+        return self.by_id.get(member_id)
+
+    def member(self, member_id):
+        """Return the member with member_id, adding it on first sight"""
+        member = self.by_id.get(member_id)
+        if member is None:
+            member = self.by_id[member_id] = FakeMember(member_id, self, self.rest)
+            self.members.append(member)
+        return member
+
+    def get_role(self, role_id):
+        return FakeRole(role_id)
+
+class FakeMessage:
+    def __init__(self, author, content, channel=None, message_id=None, mentions=0, role_mentions=0):
+        self.id = message_id
+        self.author = author
+        self.guild = author.guild
+        self.channel = channel or author.guild.text_channel
+        self.content = content
+        self.mentions = [author] * mentions
+        self.role_mentions = [FakeRole(0)] * role_mentions
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+        await self.author.rest.call()
+
+def random_words(rng, count):
+    return ' '.join(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(2, 9)))
+                    for _ in range(count))
+
+def chat_line(rng):
+    """Ordinary conversation: mostly lowercase words, sometimes a custom command or an emoji"""
+    roll = rng.random()
+    if roll < 0.05:
+        return f"!cmd{rng.randrange(20)}"
+    line = random_words(rng, rng.randint(3, 25))
+    if roll < 0.15:
+        line += " 😀"
+    return line.capitalize()
+
+def chat_member(rng, members):
+    # A few regulars write most of the chat, as in a real server
+    return int(members * rng.random() ** 2)
+
+# Each scenario returns (automod settings, banned words, message stream as
+# [(seconds, member index, content, breaks a rule)] in time order)
+def quiet_chat(rng, members):
+    settings = {'spam_enabled': 1, 'caps_enabled': 1, 'mentions_enabled': 1, 'emoji_enabled': 1,
+                'duplicate_enabled': 1}
+    stream = [(i / CHAT_RATE, chat_member(rng, members), chat_line(rng), False) for i in range(members * 4)]
+    return settings, [], stream
+
+def spam_wave(rng, members):
+    # A fifth of the members each post SPAM_BURST messages SPAM_GAP apart at some point during normal chat
+    chat = [(i / CHAT_RATE, chat_member(rng, members), chat_line(rng)) for i in range(members * 2)]
+    bursts = {member: rng.uniform(0, len(chat) / CHAT_RATE) for member in rng.sample(range(members), members // 5)}
+    # The spam filter counts every message, so a spammer's ordinary lines during the burst break the rule too
+    stream = [(at, member, line, member in bursts and 0 <= at - bursts[member] <= SPAM_BURST * SPAM_GAP + SPAM_INTERVAL)
+              for at, member, line in chat]
+    for member, start in bursts.items():
+        stream.extend((start + i * SPAM_GAP, member, "FREE NITRO " + random_words(rng, 3), True)
+                      for i in range(SPAM_BURST))
+    stream.sort(key=lambda entry: entry[0])
+    settings = {'spam_enabled': 1, 'spam_interval': SPAM_INTERVAL, 'caps_enabled': 1, 'duplicate_enabled': 1}
+    return settings, [], stream
+
+def link_flood(rng, members):
+    hosts = ['youtube.com', 'example.com', 'scam-site.net', 'github.com']
+    stream = []
+    for i in range(members * 4):
+        host = rng.choice(hosts)
+        stream.append((i / CHAT_RATE, chat_member(rng, members),
+                       f"look https://{host}/{random_words(rng, 1)} {random_words(rng, 4)}",
+                       host not in ('youtube.com', 'github.com')))
+    return {'spam_enabled': 0, 'links_enabled': 1}, [], stream
+
+def word_list_10k(rng, members):
+    # Longer than any chat word, so only the appended words match
+    words = sorted({''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(10, 16))) for _ in range(10000)})
+    stream = []
+    for i in range(members * 4):
+        line = chat_line(rng)
+        banned = rng.random() < 0.02
+        if banned:
+            line += " " + rng.choice(words)
+        stream.append((i / CHAT_RATE, chat_member(rng, members), line, banned))
+    return {'spam_enabled': 0, 'words_enabled': 1}, words, stream
+
+SCENARIOS = {
+    'quiet_chat': quiet_chat,
+    'spam_wave': spam_wave,
+    'link_flood': link_flood,
+    'word_list_10k': word_list_10k,
+}
+
+def seed_guild(guild, settings, banned_words):
+    """Write a scenario's auto-moderation setup, custom commands and whitelist for one guild"""
+    columns = {'enabled': 1, 'log_channel_id': LOG_CHANNEL_ID, **settings}
+    conn = sqlite3.connect(Main.DB_FILE)
+    conn.execute(f'INSERT INTO automod_settings (guild_id, {", ".join(columns)}) VALUES (?{", ?" * len(columns)})',
+                 (guild.id, *columns.values()))
+    conn.executemany('INSERT INTO automod_banned_words (guild_id, word) VALUES (?, ?)',
+                     [(guild.id, word) for word in banned_words])
+    conn.executemany('INSERT INTO automod_whitelist (guild_id, link) VALUES (?, ?)',
+                     [(guild.id, 'youtube.com'), (guild.id, 'github.com')])
+    conn.executemany('INSERT INTO custom_commands (guild_id, name, response, creator_id, created_at) VALUES (?, ?, ?, ?, ?)',
+                     [(guild.id, f"cmd{i}", f"Response {i}", BOT_USER_ID, int(time.time())) for i in range(20)])
+    conn.commit()
+    conn.close()
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+async def settle():
+    """Wait for enforcement and log batches queued by the stream, then flush XP"""
+    while Main.enforcement_queue.queues or Main.log_dispatcher.queues:
+        await asyncio.sleep(0.01)
+    await Main.flush_pending_xp()
+
+def level_ups(guild_id):
+    conn = sqlite3.connect(Main.DB_FILE)
+    levels = conn.execute('SELECT COALESCE(SUM(level), 0) FROM user_levels WHERE guild_id = ?', (guild_id,)).fetchone()[0]
+    conn.close()
+    return levels
+
+async def run_scenario(name, guild_id, members, concurrency, rest_latency, seed, clock):
+    rng = random.Random(seed)
+    rest = FakeRest(rest_latency)
+    guild = FakeGuild(guild_id, members, rest)
+    settings, banned_words, stream = SCENARIOS[name](rng, members)
+    seed_guild(guild, settings, banned_words)
+
+    log_channel = FakeChannel(LOG_CHANNEL_ID, rest)
+    Main.bot.get_channel = lambda channel_id: log_channel if channel_id == LOG_CHANNEL_ID else None
+    Main.bot.get_guild = lambda guild_id: guild if guild_id == guild.id else None
+
+    statements = 0
+    db_jobs = 0
+    run_db = Main.run_db
+
+    def count_statement(sql):
+        nonlocal statements
+        statements += 1
+
+    async def counting_run_db(func, *args):
+        nonlocal db_jobs
+        db_jobs += 1
+        return await run_db(func, *args)
+
+    await run_db(lambda cursor: cursor.connection.set_trace_callback(count_statement))
+    Main.run_db = counting_run_db
+
+    messages = [FakeMessage(guild.members[member], content) for _, member, content, _ in stream]
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def deliver(message):
+        # Like discord.py, each event runs as its own task; latency is from dispatch to return
+        try:
+            start = time.perf_counter()
+            await Main.on_message(message)
+            latencies.append(time.perf_counter() - start)
+        finally:
+            slots.release()
+
+    # Scenario time continues from the previous scenario so the bot's clock never runs backwards
+    origin = clock.now
+    next_flush = Main.XP_FLUSH_INTERVAL
+    in_flight = set()
+    Main.time = clock
+    try:
+        start = time.perf_counter()
+        for message, (at, *_) in zip(messages, stream):
+            if at >= next_flush:
+                clock.now = origin + at
+                await Main.flush_xp()
+                next_flush = at + Main.XP_FLUSH_INTERVAL
+            await slots.acquire()
+            clock.now = origin + at
+            task = asyncio.create_task(deliver(message))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        while in_flight:
+            await asyncio.gather(*in_flight)
+        elapsed = time.perf_counter() - start
+        settle_start = time.perf_counter()
+        await settle()
+        settle_elapsed = time.perf_counter() - settle_start
+    finally:
+        Main.time = time
+        Main.run_db = run_db
+        await run_db(lambda cursor: cursor.connection.set_trace_callback(None))
+
+    latencies.sort()
+    count = len(messages)
+    return {
+        'messages': count,
+        'simulated_seconds': round(stream[-1][0], 1),
+        'deleted': sum(message.deleted for message in messages),
+        'wrongly_deleted': sum(message.deleted and not breaks_rule
+                               for message, (*_, breaks_rule) in zip(messages, stream)),
+        'level_ups': level_ups(guild.id),
+        'seconds': round(elapsed, 4),
+        'settle_seconds': round(settle_elapsed, 4),
+        'messages_per_second': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 4),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 4),
+        'max_ms': round(latencies[-1] * 1000, 4),
+        'db_jobs_per_message': round(db_jobs / count, 4),
+        'sql_per_message': round(statements / count, 4),
+        'rest_per_message': round(rest.calls / count, 4),
+    }
+
+async def run_all(names, members, concurrency, rest_latency, seed):
+    Main.bot._connection.user = FakeUser(BOT_USER_ID)
+
+    async def no_prefix_commands(message):
+        pass
+
+    Main.bot.process_commands = no_prefix_commands
+    clock = SimulatedClock()
+    results = {}
+    for offset, name in enumerate(names):
+        # A separate guild per scenario keeps caches and trackers from carrying over
+        guild_id = 100000000000000000 + offset * 1000000
+        results[name] = await run_scenario(name, guild_id, members, concurrency, rest_latency, seed, clock)
+    return results
+
+COLUMNS = (
+    ('messages_per_second', 'msg/s', '.0f'),
+    ('p50_ms', 'p50 ms', '.3f'),
+    ('p99_ms', 'p99 ms', '.3f'),
+    ('db_jobs_per_message', 'db jobs/msg', '.3f'),
+    ('sql_per_message', 'sql/msg', '.3f'),
+    ('rest_per_message', 'rest/msg', '.3f'),
+    ('deleted', 'deleted', '.0f'),
+    ('wrongly_deleted', 'wrongly del', '.0f'),
+    ('level_ups', 'level-ups', '.0f'),
+)
+
+def print_results(results, baseline=None):
+    print(f"{'scenario':<15} {'msgs':>6} " + ' '.join(f"{title:>12}" for _, title, _ in COLUMNS))
+    for name, result in results.items():
+        print(f"{name:<15} {result['messages']:>6} "
+              + ' '.join(f"{result[key]:>12{spec}}" for key, _, spec in COLUMNS))
+        previous = (baseline or {}).get(name)
+        if previous:
+            changes = []
+            for key, _, _ in COLUMNS:
+                if previous.get(key):
+                    changes.append(f"{(result[key] - previous[key]) / previous[key] * 100:>+11.1f}%")
+                else:
+                    changes.append(f"{'n/a':>12}")
+            print(f"{'  vs baseline':<15} {'':>6} " + ' '.join(changes))
+    for name, result in results.items():
+        if result['wrongly_deleted']:
+            print(f"⚠️ {name}: {result['wrongly_deleted']} deleted messages broke no rule")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable; default all)")
+    parser.add_argument('--members', type=int, default=500, help="members per guild (sets stream length)")
+    parser.add_argument('--concurrency', type=int, default=1, help="messages in flight at once")
+    parser.add_argument('--rest-latency', type=float, default=0.0, help="seconds each fake REST call takes")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="results file (default benchmarks/results/harness-<time>.json)")
+    parser.add_argument('--compare', help="earlier results file to print changes against")
+    args = parser.parse_args()
+
+    names = args.scenario or list(SCENARIOS)
+    results = asyncio.run(run_all(names, args.members, args.concurrency, args.rest_latency, args.seed))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['scenarios']
+    print_results(results, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"harness-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'options': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'scenarios': results,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+if __name__ == "__main__":
+    main()
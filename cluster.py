@@ -0,0 +1,211 @@
+"""Run Chris-bot as a cluster of worker processes, each owning a contiguous range of shards.
+
+Every worker is a normal Main.py process started with SHARD_COUNT, SHARD_IDS
+and HEALTH_FILE set. It connects only its own shards, handles only the guilds
+on them, and fires only their reminders and mute expiries. All workers share
+the SQLite file:
+- WAL mode lets readers run alongside the single writer
+- busy_timeout queues competing writers instead of failing them
+- migrations take a write lock and re-check the schema version
+The launcher still applies pending migrations once, before any worker starts.
+
+Workers are started one after another, each once the previous one reports
+ready, so identifies stay inside Discord's rate limit. A worker that exits is
+restarted with backoff. cluster.json in the health directory combines every
+worker's health file.
+
+    DISCORD_TOKEN=... python cluster.py                 # one worker per core, at most one per shard
+    DISCORD_TOKEN=... python cluster.py --workers 4 --shards 16
+
+METRICS_FILE and TRACE_FILE get a -worker<N> suffix per worker.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAIN = os.path.join(ROOT, 'Main.py')
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+IDENTIFY_INTERVAL = 5
+POLL_INTERVAL = 5
+STALE_AFTER = 60
+MAX_BACKOFF = 300
+SHUTDOWN_TIMEOUT = 30
+
+def recommended_shards(token):
+    """Ask Discord for the recommended shard count and identify concurrency"""
+    request = urllib.request.Request(GATEWAY_URL, headers={
+        'Authorization': f'Bot {token}',
+        'User-Agent': 'DiscordBot (chris-bot cluster, 1.0)',
+    })
+    with urllib.request.urlopen(request, timeout=10) as response:
+        data = json.load(response)
+    return data['shards'], data['session_start_limit']['max_concurrency']
+
+def shard_ranges(shard_count, workers):
+    """Split shards 0..shard_count-1 into contiguous, nearly equal ranges, one per worker"""
+    workers = min(workers, shard_count)
+    base, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for index in range(workers):
+        size = base + (index < extra)
+        ranges.append(range(start, start + size))
+        start += size
+    return ranges
+
+def per_worker_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}-worker{index}{ext}"
+
+class Worker:
+    """One Main.py process and the shards it owns"""
+
+    def __init__(self, index, shard_ids, shard_count, health_dir):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.health_file = os.path.join(health_dir, f"worker-{index}.json")
+        self.process = None
+        self.restarts = 0
+        self.restart_at = None
+
+    def env(self):
+        env = dict(os.environ)
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['SHARD_IDS'] = f"{self.shard_ids.start}-{self.shard_ids.stop - 1}"
+        env['HEALTH_FILE'] = self.health_file
+        for name in ('METRICS_FILE', 'TRACE_FILE'):
+            if env.get(name):
+                env[name] = per_worker_path(env[name], self.index)
+        return env
+
+    def start(self):
+        if os.path.exists(self.health_file):
+            os.remove(self.health_file)
+        # Own session, so a terminal Ctrl-C reaches only the launcher, which forwards it once
+        self.process = subprocess.Popen([sys.executable, MAIN], env=self.env(), cwd=ROOT, start_new_session=True)
+        self.restart_at = None
+        print(f"🚀 Worker {self.index} (pid {self.process.pid}) started for shards "
+              f"{self.shard_ids.start}-{self.shard_ids.stop - 1}")
+
+    def health(self):
+        try:
+            with open(self.health_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def wait_ready(self, timeout):
+        """Block until the worker reports ready, exits or timeout seconds pass"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and self.process.poll() is None:
+            health = self.health()
+            if health and health['ready']:
+                return True
+            time.sleep(1)
+        return False
+
+    def status(self, now):
+        health = self.health()
+        if self.process is None or self.process.poll() is not None:
+            state = 'down'
+        elif not health:
+            state = 'starting'
+        elif now - health['updated'] > STALE_AFTER:
+            state = 'stale'
+        else:
+            state = 'ready' if health['ready'] else 'connecting'
+        return {'worker': self.index, 'state': state, 'restarts': self.restarts,
+                'shards': [self.shard_ids.start, self.shard_ids.stop - 1], 'health': health}
+
+def apply_migrations():
+    # Migrate once up front so workers start against the current schema
+    env = {name: value for name, value in os.environ.items() if name not in ('METRICS_FILE', 'TRACE_FILE')}
+    subprocess.run([sys.executable, '-c', 'import Main'], env=env, cwd=ROOT, check=True)
+
+def stop(workers):
+    # SIGINT lets bot.run() close the gateway and flush pending XP
+    for worker in workers:
+        if worker.process and worker.process.poll() is None:
+            worker.process.send_signal(signal.SIGINT)
+    deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+    for worker in workers:
+        if worker.process:
+            try:
+                worker.process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                worker.process.kill()
+
+def supervise(workers, health_dir):
+    """Restart workers that exit and keep cluster.json current until interrupted"""
+    while True:
+        now = time.time()
+        for worker in workers:
+            code = worker.process.poll()
+            if code is None:
+                continue
+            if worker.restart_at is None:
+                delay = min(MAX_BACKOFF, 2 ** worker.restarts)
+                worker.restart_at = time.monotonic() + delay
+                print(f"⚠️ Worker {worker.index} exited with code {code}; restarting in {delay}s")
+            elif time.monotonic() >= worker.restart_at:
+                worker.restarts += 1
+                worker.start()
+        statuses = [worker.status(now) for worker in workers]
+        summary = {
+            'updated': int(now),
+            'workers': statuses,
+            'ready': sum(status['state'] == 'ready' for status in statuses),
+            'guilds': sum(status['health']['guilds'] for status in statuses if status['health']),
+        }
+        with open(os.path.join(health_dir, 'cluster.json.tmp'), 'w') as f:
+            json.dump(summary, f, indent=2)
+        os.replace(os.path.join(health_dir, 'cluster.json.tmp'), os.path.join(health_dir, 'cluster.json'))
+        time.sleep(POLL_INTERVAL)
+
+def terminate(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    signal.signal(signal.SIGTERM, terminate)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="worker processes (default: CPU count; never more than shards)")
+    parser.add_argument('--shards', type=int, help="total shard count (default: Discord's recommendation)")
+    parser.add_argument('--health-dir', default=os.getenv('HEALTH_DIR', os.path.join(ROOT, 'health')))
+    args = parser.parse_args()
+
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        sys.exit("❌ Error: DISCORD_TOKEN environment variable not found!")
+
+    max_concurrency = 1
+    shard_count = args.shards
+    if not shard_count:
+        shard_count, max_concurrency = recommended_shards(token)
+
+    os.makedirs(args.health_dir, exist_ok=True)
+    apply_migrations()
+    workers = [Worker(index, shard_ids, shard_count, args.health_dir)
+               for index, shard_ids in enumerate(shard_ranges(shard_count, args.workers))]
+    print(f"🧩 {shard_count} shards across {len(workers)} workers")
+
+    try:
+        for worker in workers:
+            worker.start()
+            # Each bucket of max_concurrency shards identifies once per IDENTIFY_INTERVAL
+            batches = -(-len(worker.shard_ids) // max_concurrency)
+            if not worker.wait_ready(batches * IDENTIFY_INTERVAL + 60):
+                print(f"⚠️ Worker {worker.index} not ready yet; starting the next one anyway")
+        supervise(workers, args.health_dir)
+    except KeyboardInterrupt:
+        print("🛑 Stopping workers")
+    finally:
+        stop(workers)
+
+if __name__ == "__main__":
+    main()
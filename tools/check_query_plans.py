@@ -0,0 +1,55 @@
+"""Fail if any SQL query in Main.py needs a full table scan.
+
+Builds a fresh database through init_database() and the MIGRATIONS list, then
+runs EXPLAIN QUERY PLAN on every SELECT/UPDATE/DELETE string literal in
+Main.py. Any SCAN step (outside SQLite's own schema tables and the
+INTENTIONAL_SCANS below) is reported and the script exits non-zero.
+
+    python tools/check_query_plans.py
+"""
+import ast
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+os.environ['CHRISBOT_DB'] = os.path.join(tempfile.mkdtemp(), 'plans.db')
+
+import Main
+
+QUERY_PREFIXES = ('SELECT ', 'UPDATE ', 'DELETE ')
+
+# Queries that read a whole table on purpose, with the reason
+INTENTIONAL_SCANS = {
+    'SELECT message_id, emoji, role_id FROM reaction_role_mappings':
+        'loads the full ReactionRoleIndex once per REACTION_ROLE_TTL',
+}
+
+def known_queries(path):
+    """Yield (line, sql) for every plain string literal in the file that is a query"""
+    tree = ast.parse(open(path, encoding='utf-8').read())
+    formatted = {id(part) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for part in node.values}
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Constant) and isinstance(node.value, str)
+                and id(node) not in formatted and node.value.lstrip().startswith(QUERY_PREFIXES)):
+            yield node.lineno, ' '.join(node.value.split())
+
+def main():
+    conn = Main.get_db()
+    failures = 0
+    queries = sorted(known_queries(os.path.join(ROOT, 'Main.py')))
+    for line, sql in queries:
+        if sql in INTENTIONAL_SCANS:
+            continue
+        plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', (None,) * sql.count('?')).fetchall()
+        scans = [detail for *_, detail in plan
+                 if detail.startswith('SCAN') and not detail.startswith('SCAN sqlite_')]
+        if scans:
+            failures += 1
+            print(f"Main.py:{line}: {'; '.join(scans)}\n    {sql}")
+    print(f"{len(queries)} queries checked, {failures} with full scans")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""Replay a gateway trace recorded with TRACE_FILE through the bot's event handlers.
+
+Events are dispatched as tasks, as discord.py does, at the recorded pace
+scaled by --speed (or as fast as the loop allows with --speed max). The run
+uses the fake guilds, members and REST layer from benchmarks/harness.py and a
+temporary database. Every guild in the trace has auto-moderation enabled with
+the default filters, plus a log, welcome and goodbye channel. --copies replays
+the trace N times at once under distinct IDs. That shows how many guilds like
+the recorded ones one process keeps up with.
+
+    TRACE_FILE=war-night.jsonl python Main.py            # record
+    python tools/replay_trace.py war-night.jsonl --speed 10
+    python tools/replay_trace.py war-night.jsonl --speed max --copies 20
+
+Words in the trace are pseudonymized, so banned-word and custom-command
+lookups run but do not match the recorded guild's lists.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ['CHRISBOT_DB'] = os.path.join(tempfile.mkdtemp(), 'replay.db')
+os.environ.pop('TRACE_FILE', None)
+
+import Main
+from harness import (BOT_USER_ID, LOG_CHANNEL_ID, FakeChannel, FakeGuild, FakeMessage, FakeRest, FakeUser,
+                     percentile, seed_guild)
+
+def load_trace(path):
+    """Return [(seconds, kind, fields)] with the recorded segments laid end to end"""
+    events = []
+    offset = 0.0
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if isinstance(record, dict):
+                # A new segment starts where the previous one ended
+                offset = events[-1][0] if events else 0.0
+                continue
+            t, kind, fields = record
+            events.append((offset + t, kind, fields))
+    return events
+
+class Replay:
+    """Maps trace IDs to fake objects and feeds events to the handlers"""
+
+    def __init__(self, rest):
+        self.rest = rest
+        self.ids = {}
+        self.guilds = {}
+        self.channels = {}
+        self.log_channel = FakeChannel(LOG_CHANNEL_ID, rest)
+
+    def local_id(self, copy, trace_id):
+        # Dense local IDs keep every copy apart and stay well inside SQLite's INTEGER range
+        key = (copy, trace_id)
+        local = self.ids.get(key)
+        if local is None:
+            local = self.ids[key] = 10 ** 15 + len(self.ids)
+        return local
+
+    def prepare(self, events, copies):
+        """Create and configure every guild in the trace before the clock starts"""
+        for copy in range(copies):
+            for _, _, fields in events:
+                guild_id = self.local_id(copy, fields['g'])
+                if guild_id not in self.guilds:
+                    guild = self.guilds[guild_id] = FakeGuild(guild_id, 0, self.rest)
+                    seed_guild(guild, {}, [])
+        conn = sqlite3.connect(Main.DB_FILE)
+        conn.executemany('''INSERT INTO guild_settings (guild_id, log_channel_id, welcome_channel_id, welcome_message,
+                            goodbye_channel_id, goodbye_message) VALUES (?, ?, ?, ?, ?, ?)''',
+                         [(guild_id, LOG_CHANNEL_ID, LOG_CHANNEL_ID, "Welcome {user} to {server}!",
+                           LOG_CHANNEL_ID, "Goodbye {user}") for guild_id in self.guilds])
+        conn.commit()
+        conn.close()
+
+    def guild(self, copy, fields):
+        return self.guilds[self.local_id(copy, fields['g'])]
+
+    def channel(self, copy, trace_id):
+        channel_id = self.local_id(copy, trace_id)
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(channel_id, self.rest)
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.log_channel if channel_id == LOG_CHANNEL_ID else self.channels.get(channel_id)
+
+    def message(self, copy, fields, text):
+        guild = self.guild(copy, fields)
+        return FakeMessage(guild.member(self.local_id(copy, fields['a'])), text,
+                           channel=self.channel(copy, fields['c']), message_id=self.local_id(copy, fields['id']),
+                           mentions=fields.get('m', 0), role_mentions=fields.get('r', 0))
+
+    def reaction(self, copy, fields):
+        guild = self.guild(copy, fields)
+        return SimpleNamespace(guild_id=guild.id, channel_id=self.local_id(copy, fields['c']),
+                               user_id=self.local_id(copy, fields['u']), message_id=self.local_id(copy, fields['id']),
+                               emoji=fields['emoji'], member=None)
+
+    async def dispatch(self, copy, kind, fields):
+        if kind == 'message':
+            await Main.on_message(self.message(copy, fields, fields['text']))
+        elif kind == 'edit':
+            before = self.message(copy, fields, fields['before'])
+            after = self.message(copy, fields, fields['after'])
+            await Main.on_message_edit(before, after)
+        elif kind == 'delete':
+            await Main.on_message_delete(self.message(copy, fields, fields['text']))
+        elif kind == 'reaction_add':
+            await Main.on_raw_reaction_add(self.reaction(copy, fields))
+        elif kind == 'reaction_remove':
+            await Main.on_raw_reaction_remove(self.reaction(copy, fields))
+        elif kind == 'join':
+            await Main.on_member_join(self.guild(copy, fields).member(self.local_id(copy, fields['u'])))
+        elif kind == 'leave':
+            await Main.on_member_remove(self.guild(copy, fields).member(self.local_id(copy, fields['u'])))
+
+async def replay(events, speed, copies, rest_latency):
+    rest = FakeRest(rest_latency)
+    state = Replay(rest)
+    state.prepare(events, copies)
+    Main.bot._connection.user = FakeUser(BOT_USER_ID)
+    Main.bot.get_channel = state.get_channel
+    Main.bot.get_guild = state.guilds.get
+
+    async def no_prefix_commands(message):
+        pass
+
+    Main.bot.process_commands = no_prefix_commands
+
+    db_jobs = 0
+    run_db = Main.run_db
+
+    async def counting_run_db(func, *args):
+        nonlocal db_jobs
+        db_jobs += 1
+        return await run_db(func, *args)
+
+    Main.run_db = counting_run_db
+
+    latencies = {}
+    lags = []
+    in_flight = set()
+    peak_in_flight = 0
+
+    async def handle(copy, kind, fields):
+        start = time.perf_counter()
+        try:
+            await state.dispatch(copy, kind, fields)
+        except Exception as e:
+            print(f"Error replaying {kind}: {e}")
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for t, kind, fields in events:
+        if speed:
+            target = start + t / speed
+            delay = target - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            lags.append(max(0.0, loop.time() - target))
+        for copy in range(copies):
+            task = asyncio.create_task(handle(copy, kind, fields))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        peak_in_flight = max(peak_in_flight, len(in_flight))
+        if not speed:
+            # Let handlers run between events, as reading the next gateway frame would
+            await asyncio.sleep(0)
+    while in_flight:
+        await asyncio.gather(*in_flight)
+    elapsed = loop.time() - start
+    # Enforcement and log batches queued by the trace still count towards the per-event totals
+    while Main.enforcement_queue.queues or Main.log_dispatcher.queues:
+        await asyncio.sleep(0.01)
+    await Main.flush_pending_xp()
+    settled = loop.time() - start - elapsed
+    Main.run_db = run_db
+    return elapsed, settled, latencies, lags, peak_in_flight, db_jobs, rest.calls, len(state.guilds)
+
+def parse_speed(value):
+    return 0.0 if value == 'max' else float(value)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('trace', help="trace file written with TRACE_FILE")
+    parser.add_argument('--speed', type=parse_speed, default=1.0, help="time scale, e.g. 1, 10 or max")
+    parser.add_argument('--copies', type=int, default=1, help="replay the trace this many times at once")
+    parser.add_argument('--rest-latency', type=float, default=0.05, help="seconds each fake REST call takes")
+    args = parser.parse_args()
+
+    events = load_trace(args.trace)
+    if not events:
+        sys.exit(f"No events in {args.trace}")
+    elapsed, settled, latencies, lags, peak_in_flight, db_jobs, rest_calls, guilds = asyncio.run(
+        replay(events, args.speed, args.copies, args.rest_latency))
+
+    total = len(events) * args.copies
+    recorded = events[-1][0] - events[0][0]
+    print(f"{total} events over {guilds} guilds in {elapsed:.2f}s ({total / elapsed:.0f} events/s), "
+          f"peak {peak_in_flight} in flight")
+    print(f"background work (enforcement, log batches, XP flush) drained {settled:.2f}s after the last event")
+    print(f"{db_jobs / total:.3f} db jobs and {rest_calls / total:.3f} REST calls per event")
+    if lags:
+        lags.sort()
+        print(f"dispatch lag behind schedule: p50 {percentile(lags, 0.5) * 1000:.1f}ms "
+              f"p99 {percentile(lags, 0.99) * 1000:.1f}ms max {lags[-1] * 1000:.1f}ms")
+    if recorded > 0:
+        # How many copies of the recorded load this run's event rate could absorb
+        print(f"recorded rate {len(events) / recorded:.1f} events/s; this run sustained "
+              f"{total / elapsed / (len(events) / recorded):.1f}x the recorded load")
+    print(f"{'event':<16} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, values in sorted(latencies.items()):
+        values.sort()
+        print(f"{kind:<16} {len(values):>7} {percentile(values, 0.5) * 1000:>9.2f} "
+              f"{percentile(values, 0.99) * 1000:>9.2f} {values[-1] * 1000:>9.2f}")
+
+if __name__ == "__main__":
+    main()